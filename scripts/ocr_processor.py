@@ -4,13 +4,1378 @@ PaddleOCR Receipt Processing Script
 Extracts text from receipt images and attempts to parse structured data
 """
 
+import argparse
+import csv
+import hashlib
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import random
+import select
+import socket
+import sqlite3
+import subprocess
 import sys
 import json
+import threading
+import time
 import re
+import traceback
+import unicodedata
+import uuid
 import requests
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from paddleocr import PaddleOCR
+from urllib.parse import urlsplit
+
+def _cache_dir() -> Path:
+    """Directory for small on-disk caches shared between CLI invocations (created on first write)"""
+    return Path(os.environ.get('OCR_PROCESSOR_CACHE_DIR', Path.home() / '.cache' / 'ocr_processor'))
+
+
+def _write_json_atomic(path: Path, data: Dict):
+    """Write JSON via a temporary file so concurrent readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(data), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(name: str):
+    """Load (once per model) a local tokenizer for prompt budgeting; None if unavailable"""
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        print("tokenizers package not installed, estimating 1 token per character", file=sys.stderr)
+        return None
+
+    try:
+        if Path(name).exists():
+            return Tokenizer.from_file(name)
+
+        # Only use a tokenizer already in the Hugging Face cache, never download during a request
+        from huggingface_hub import try_to_load_from_cache
+
+        cached_path = try_to_load_from_cache(name, 'tokenizer.json')
+        if isinstance(cached_path, str):
+            return Tokenizer.from_file(cached_path)
+        print(f"Tokenizer for {name} not cached (huggingface-cli download {name} tokenizer.json), "
+              f"estimating 1 token per character", file=sys.stderr)
+    except Exception as e:
+        print(f"Could not load tokenizer {name}, estimating 1 token per character: {e}", file=sys.stderr)
+    return None
+
+
+class LLMEndpointDiscovery:
+    """Discover the reachable LM Studio endpoint and remember it between runs"""
+
+    def __init__(self, base_endpoints: List[str], port: int = 1235, ttl: float = 3600, cache_path: Optional[Path] = None):
+        self.base_endpoints = list(base_endpoints)
+        self.port = port
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self._cache = None
+
+    def candidate_endpoints(self) -> List[str]:
+        """Configured endpoints plus the WSL2 mDNS hostname and Windows host from resolv.conf"""
+        candidates = list(self.base_endpoints)
+
+        # Method 1: Windows host via hostname.local (mDNS)
+        hostname = socket.gethostname()
+        if hostname:
+            candidates.append(f"http://{hostname}.local:{self.port}/v1")
+
+        # Method 2: Windows host IP from resolv.conf
+        try:
+            with open('/etc/resolv.conf') as resolv_conf:
+                for line in resolv_conf:
+                    if line.startswith('nameserver'):
+                        candidates.append(f"http://{line.split()[-1]}:{self.port}/v1")
+                        break
+        except OSError:
+            pass
+
+        return list(dict.fromkeys(candidates))
+
+    def _load_cache(self) -> Dict:
+        if self._cache is None:
+            try:
+                self._cache = json.loads(self._get_cache_path().read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _get_cache_path(self) -> Path:
+        if self.cache_path is None:
+            self.cache_path = _cache_dir() / 'llm_endpoint.json'
+        return self.cache_path
+
+    def is_fresh(self) -> bool:
+        """Whether the cached discovery result is still within its TTL"""
+        cache = self._load_cache()
+        return bool(cache) and time.time() - cache.get('discovered_at', 0) < self.ttl
+
+    def ordered_endpoints(self) -> List[str]:
+        """Candidate endpoints with the cached known-good endpoint first; never touches the network"""
+        candidates = self.candidate_endpoints()
+        known_good = self._load_cache().get('endpoint') if self.is_fresh() else None
+        if known_good:
+            candidates = [known_good] + [endpoint for endpoint in candidates if endpoint != known_good]
+        return candidates
+
+    def record_success(self, endpoint: str):
+        """Persist the endpoint that answered so later runs start from it"""
+        cache = self._load_cache()
+        if cache.get('endpoint') == endpoint and self.is_fresh():
+            return
+        self._cache = {'endpoint': endpoint, 'discovered_at': time.time()}
+        self._save_cache()
+
+    def record_failure(self):
+        """Remember that no endpoint answered so the probe is not repeated until the TTL expires"""
+        self._cache = {'endpoint': None, 'discovered_at': time.time()}
+        self._save_cache()
+
+    def _save_cache(self):
+        try:
+            _write_json_atomic(self._get_cache_path(), self._cache)
+        except OSError as e:
+            print(f"Could not write LLM endpoint cache: {e}", file=sys.stderr)
+
+    def probe(self, timeout: float = 1.0) -> Optional[str]:
+        """Probe all candidates concurrently and record the first one in priority order that answers"""
+        candidates = self.ordered_endpoints()
+
+        def check(endpoint: str) -> bool:
+            try:
+                return requests.get(f"{endpoint}/models", timeout=timeout).status_code == 200
+            except requests.exceptions.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            reachable = list(executor.map(check, candidates))
+
+        for endpoint, ok in zip(candidates, reachable):
+            if ok:
+                self.record_success(endpoint)
+                return endpoint
+        self.record_failure()
+        return None
+
+
+class SQLiteStore:
+    """SQLite database shared between threads, opened (with its directory and tables) on first use.
+
+    If it cannot be opened the store disables itself and _connection() returns None.
+    """
+
+    schema: List[str] = []
+    unavailable_message = 'SQLite database unavailable'
+
+    def __init__(self, db_path: Optional[Path]):
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self.db_path is None:
+            return None
+        # SQLite handles must not cross a fork
+        if self._db is None or self._db_pid != os.getpid():
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+                for statement in self.schema:
+                    self._db.execute(statement)
+                self._db.commit()
+                self._db_pid = os.getpid()
+            except (OSError, sqlite3.Error) as e:
+                print(f"{self.unavailable_message}: {e}", file=sys.stderr)
+                self.db_path = None
+                self._db = None
+        return self._db
+
+
+class VIESCache(SQLiteStore):
+    """SQLite cache of VIES lookups keyed by country code and VAT number.
+
+    Valid, invalid and rate-limited (MS_MAX_CONCURRENT_REQ) answers expire after their own TTL.
+    """
+
+    schema = [
+        'CREATE TABLE IF NOT EXISTS vies_cache ('
+        'country_code TEXT NOT NULL, vat_number TEXT NOT NULL, status TEXT NOT NULL, '
+        'valid INTEGER, company_name TEXT, company_address TEXT, request_date TEXT, '
+        'result TEXT NOT NULL, cached_at REAL NOT NULL, '
+        'PRIMARY KEY (country_code, vat_number))'
+    ]
+    unavailable_message = 'VIES cache database unavailable, caching disabled'
+
+    def __init__(self, db_path: Path, ttl_valid: float, ttl_invalid: float, ttl_rate_limited: float):
+        super().__init__(db_path)
+        self.ttls = {'valid': ttl_valid, 'invalid': ttl_invalid, 'rate_limited': ttl_rate_limited}
+        self.stats_counters = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def _status(result: Dict) -> str:
+        if result.get('valid') is None:
+            return 'rate_limited'
+        return 'valid' if result['valid'] else 'invalid'
+
+    def get(self, country_code: str, vat_number: str) -> Optional[Dict]:
+        """Cached VIES result still within the TTL for its status, marked with 'cached': True"""
+        with self._lock:
+            db = self._connection()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute(
+                        'SELECT status, result, cached_at FROM vies_cache WHERE country_code = ? AND vat_number = ?',
+                        (country_code.upper(), vat_number.upper())
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+
+            if row is None or time.time() - row[2] >= self.ttls[row[0]]:
+                self.stats_counters['misses'] += 1
+                return None
+
+            self.stats_counters['hits'] += 1
+            result = json.loads(row[1])
+            result.update({'cached': True, 'cached_at': row[2]})
+            return result
+
+    def put(self, country_code: str, vat_number: str, result: Dict):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    'INSERT OR REPLACE INTO vies_cache (country_code, vat_number, status, valid, company_name, '
+                    'company_address, request_date, result, cached_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (country_code.upper(), vat_number.upper(), self._status(result), result.get('valid'),
+                     result.get('company_name'), result.get('company_address'), result.get('validation_date'),
+                     json.dumps(result, ensure_ascii=False), time.time())
+                )
+                db.commit()
+                self.stats_counters['stores'] += 1
+            except sqlite3.Error as e:
+                print(f"Could not cache VIES result: {e}", file=sys.stderr)
+
+    def stats(self) -> Dict:
+        lookups = self.stats_counters['hits'] + self.stats_counters['misses']
+        return {
+            **self.stats_counters,
+            'hit_rate': round(self.stats_counters['hits'] / lookups, 3) if lookups else None
+        }
+
+
+class VIESClient:
+    """Concurrent VIES lookups for batch runs.
+
+    Throttled per member state, retried with jittered backoff when VIES is overloaded, shared while in flight.
+    """
+
+    def __init__(self, lookup, cache: Optional[VIESCache] = None, rate: float = 1.0, burst: int = 2,
+                 country_rates: Optional[Dict[str, float]] = None, max_workers: int = 4,
+                 max_attempts: int = 4, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        # lookup(country_code, vat_number_only) -> (result or None, retryable) for a single request
+        self.lookup = lookup
+        self.cache = cache
+        self.rate = rate
+        self.burst = burst
+        self.country_rates = country_rates or {}
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats_counters = {'lookups': 0, 'merged': 0, 'retries': 0, 'throttled': 0}
+
+    def submit(self, country_code: str, vat_number_only: str):
+        """Future resolving to the VIES result for a number (or None), shared with identical lookups"""
+        key = (country_code.upper(), vat_number_only.upper())
+        if self.cache is not None:
+            cached = self.cache.get(*key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats_counters['merged'] += 1
+                return future
+            self.stats_counters['lookups'] += 1
+            future = self._executor.submit(self._validate, *key)
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Tuple[str, str], future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _acquire(self, country_code: str):
+        """Block until the member state's token bucket allows another request"""
+        rate = self.country_rates.get(country_code, self.rate)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, refilled_at = self._buckets.get(country_code, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - refilled_at) * rate)
+                if tokens >= 1:
+                    self._buckets[country_code] = (tokens - 1, now)
+                    return
+                self._buckets[country_code] = (tokens, now)
+                wait = (1 - tokens) / rate
+            self.stats_counters['throttled'] += 1
+            time.sleep(wait)
+
+    def _validate(self, country_code: str, vat_number_only: str) -> Optional[Dict]:
+        result = None
+        for attempt in range(self.max_attempts):
+            self._acquire(country_code)
+            result, retryable = self.lookup(country_code, vat_number_only)
+            if not retryable or attempt == self.max_attempts - 1:
+                break
+            # Full jitter keeps parallel workers from retrying in lockstep
+            self.stats_counters['retries'] += 1
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+        if result is not None and self.cache is not None:
+            self.cache.put(country_code, vat_number_only, result)
+        return result
+
+    def stats(self) -> Dict:
+        return dict(self.stats_counters)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class VIESJobStore(SQLiteStore):
+    """SQLite store of deferred VIES validations, so results can be looked up by job id from any process"""
+
+    schema = [
+        'CREATE TABLE IF NOT EXISTS vies_jobs ('
+        'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, candidates TEXT NOT NULL, result TEXT, '
+        'claimed_by INTEGER, claimed_at REAL, created_at REAL NOT NULL, completed_at REAL)',
+        'CREATE INDEX IF NOT EXISTS vies_jobs_status ON vies_jobs (status)',
+        'CREATE INDEX IF NOT EXISTS vies_jobs_created_at ON vies_jobs (created_at)'
+    ]
+    unavailable_message = 'VIES job store unavailable, validating inline'
+
+    def __init__(self, db_path: Path, stale_after: float = 120, retention: float = 7 * 24 * 3600):
+        super().__init__(db_path)
+        self.stale_after = stale_after  # Seconds before a claimed but unfinished job may be picked up again
+        self.retention = retention  # Seconds a job can be looked up before it is deleted
+
+    def create(self, candidates: List[Dict], claim: bool = True) -> Optional[str]:
+        """Record a pending job (claimed by this process unless claim is False); None if the store is unavailable"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                db.execute(
+                    'INSERT INTO vies_jobs (job_id, status, candidates, claimed_by, claimed_at, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (job_id, 'pending', json.dumps(candidates, ensure_ascii=False),
+                     os.getpid() if claim else None, now if claim else None, now)
+                )
+                # Evict expired jobs, completed or given up
+                db.execute('DELETE FROM vies_jobs WHERE created_at <= ?', (now - self.retention,))
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Could not create VIES job: {e}", file=sys.stderr)
+                return None
+        return job_id
+
+    def claim_pending(self) -> List[Tuple[str, List[Dict]]]:
+        """Claim unclaimed (or abandoned) pending jobs for this process"""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return []
+            try:
+                rows = db.execute(
+                    'SELECT job_id, candidates FROM vies_jobs WHERE status = ? AND (claimed_at IS NULL OR claimed_at < ?)',
+                    ('pending', now - self.stale_after)
+                ).fetchall()
+                for job_id, candidates in rows:
+                    cursor = db.execute(
+                        'UPDATE vies_jobs SET claimed_by = ?, claimed_at = ? WHERE job_id = ? AND status = ? '
+                        'AND (claimed_at IS NULL OR claimed_at < ?)',
+                        (os.getpid(), now, job_id, 'pending', now - self.stale_after)
+                    )
+                    if cursor.rowcount == 1:
+                        claimed.append((job_id, json.loads(candidates)))
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Could not claim pending VIES jobs: {e}", file=sys.stderr)
+                db.rollback()
+                return []
+        return claimed
+
+    def complete(self, job_id: str, result: Dict):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    'UPDATE vies_jobs SET status = ?, result = ?, completed_at = ? WHERE job_id = ?',
+                    ('completed', json.dumps(result, ensure_ascii=False), time.time(), job_id)
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Could not store VIES job {job_id}: {e}", file=sys.stderr)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    'SELECT status, candidates, result, created_at, completed_at FROM vies_jobs WHERE job_id = ?',
+                    (job_id,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Could not read VIES job {job_id}: {e}", file=sys.stderr)
+                return None
+        if row is None:
+            return None
+        job = {
+            'job_id': job_id,
+            'status': row[0],
+            'vat_numbers': [vat_info['vat_number'] for vat_info in json.loads(row[1])],
+            'created_at': row[3],
+            'completed_at': row[4]
+        }
+        if row[2]:
+            job.update(json.loads(row[2]))
+        return job
+
+
+class EndpointHealthRegistry:
+    """Per-endpoint success rate, latency percentiles and circuit state, shared through a small file.
+
+    An open circuit admits one half-open trial request after cooldown; its outcome closes or reopens it.
+    """
+
+    def __init__(self, endpoints: List[str], default_timeout: float = 20, failure_threshold: int = 3,
+                 cooldown: float = 60, timeout_min: float = 5, timeout_max: float = 60,
+                 state_path: Optional[Path] = None):
+        self.endpoints = list(endpoints)
+        self.default_timeout = default_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timeout_min = timeout_min
+        self.timeout_max = timeout_max
+        self.state_path = state_path
+        self._state = {}
+        self._loaded_mtime = None
+        self._rlock = None
+        self._rlock_pid = None
+        self._probe_thread = None
+
+    @property
+    def _lock(self) -> threading.RLock:
+        # A lock held by a thread of the parent would stay held forever in a forked child, start over
+        if self._rlock is None or self._rlock_pid != os.getpid():
+            self._rlock = threading.RLock()
+            self._rlock_pid = os.getpid()
+        return self._rlock
+
+    def _get_state_path(self) -> Path:
+        if self.state_path is None:
+            self.state_path = _cache_dir() / 'llm_endpoint_health.json'
+        return self.state_path
+
+    def _reload(self):
+        """Pick up state written by other processes since we last read or wrote the file"""
+        try:
+            mtime = self._get_state_path().stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            self._state = json.loads(self._get_state_path().read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        self._loaded_mtime = mtime
+
+    def _save(self):
+        try:
+            _write_json_atomic(self._get_state_path(), self._state)
+            self._loaded_mtime = self._get_state_path().stat().st_mtime
+        except OSError as e:
+            print(f"Could not write LLM endpoint health: {e}", file=sys.stderr)
+
+    def _entry(self, endpoint: str) -> Dict:
+        return self._state.setdefault(endpoint, {
+            'successes': 0, 'failures': 0, 'consecutive_failures': 0,
+            'latencies': [], 'circuit': 'closed', 'opened_at': None, 'trial_started': None
+        })
+
+    def record(self, endpoint: str, success: bool, latency: Optional[float] = None):
+        """Record the outcome of one request and open or close the circuit accordingly.
+
+        success is whether the endpoint answered over HTTP; latency is also recorded for
+        timed-out requests, at the timeout they hit.
+        """
+        with self._lock:
+            self._reload()
+            entry = self._entry(endpoint)
+            entry['trial_started'] = None
+            if latency is not None:
+                # Keep a bounded window of recent latencies for the percentiles
+                entry['latencies'] = (entry['latencies'] + [round(latency, 3)])[-50:]
+            if success:
+                entry['successes'] += 1
+                entry['consecutive_failures'] = 0
+                entry['circuit'] = 'closed'
+                entry['opened_at'] = None
+            else:
+                entry['failures'] += 1
+                entry['consecutive_failures'] += 1
+                if entry['circuit'] == 'half_open' or entry['consecutive_failures'] >= self.failure_threshold:
+                    if entry['circuit'] != 'open':
+                        print(f"Opening circuit for LLM endpoint {endpoint}", file=sys.stderr)
+                    entry['circuit'] = 'open'
+                    entry['opened_at'] = time.time()
+            self._save()
+
+    def _is_blocked(self, entry: Optional[Dict], now: float) -> bool:
+        """Open within cooldown, or half-open with a trial still in flight (given up after timeout_max)"""
+        if not entry or entry['circuit'] == 'closed':
+            return False
+        if entry['circuit'] == 'open':
+            return now - entry['opened_at'] < self.cooldown
+        trial_started = entry.get('trial_started')
+        return trial_started is not None and now - trial_started < self.timeout_max
+
+    def is_available(self, endpoint: str) -> bool:
+        """Whether a request could be sent to the endpoint now, without claiming a half-open trial"""
+        with self._lock:
+            self._reload()
+            return not self._is_blocked(self._state.get(endpoint), time.time())
+
+    def available_endpoints(self, endpoints: List[str]) -> List[str]:
+        return [endpoint for endpoint in endpoints if self.is_available(endpoint)]
+
+    def claim(self, endpoint: str) -> bool:
+        """Call right before a request: False while the endpoint is skipped, else takes any half-open trial"""
+        with self._lock:
+            self._reload()
+            entry = self._state.get(endpoint)
+            if not entry or entry['circuit'] == 'closed':
+                return True
+            now = time.time()
+            if self._is_blocked(entry, now):
+                return False
+            entry['circuit'] = 'half_open'
+            entry['trial_started'] = now
+            self._save()
+            return True
+
+    @staticmethod
+    def _percentile(values: List[float], percentile: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))]
+
+    def timeout_for(self, endpoint: str) -> float:
+        """Read timeout from observed p95 latency within [timeout_min, timeout_max], or the default until there is data"""
+        with self._lock:
+            self._reload()
+            latencies = self._state.get(endpoint, {}).get('latencies', [])
+        if len(latencies) < 5:
+            return self.default_timeout
+        return min(self.timeout_max, max(self.timeout_min, self._percentile(latencies, 0.95) * 1.5))
+
+    def probe_open_circuits(self, timeout: float = 1.0):
+        """Move open endpoints past their cooldown to half-open when /models answers"""
+        for endpoint in self.endpoints:
+            with self._lock:
+                self._reload()
+                entry = self._state.get(endpoint)
+                due = entry and entry['circuit'] == 'open' and time.time() - entry['opened_at'] >= self.cooldown
+            if not due:
+                continue
+            try:
+                reachable = requests.get(f"{endpoint}/models", timeout=timeout).status_code == 200
+            except requests.exceptions.RequestException:
+                reachable = False
+            with self._lock:
+                entry = self._entry(endpoint)
+                if reachable:
+                    entry['circuit'] = 'half_open'
+                    entry['trial_started'] = None
+                else:
+                    entry['opened_at'] = time.time()
+                self._save()
+
+    def start_background_probes(self, interval: Optional[float] = None):
+        """Probe open circuits from a daemon thread (for long-running worker and batch processes)"""
+        if self._probe_thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval or self.cooldown)
+                self.probe_open_circuits()
+
+        self._probe_thread = threading.Thread(target=loop, daemon=True)
+        self._probe_thread.start()
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            self._reload()
+            stats = {}
+            for endpoint, entry in self._state.items():
+                attempts = entry['successes'] + entry['failures']
+                stats[endpoint] = {
+                    'circuit': entry['circuit'],
+                    'success_rate': round(entry['successes'] / attempts, 3) if attempts else None,
+                    'p50_latency': self._percentile(entry['latencies'], 0.5),
+                    'p95_latency': self._percentile(entry['latencies'], 0.95),
+                    'timeout': self.timeout_for(endpoint)
+                }
+            return stats
+
+
+class HTTPSessionPool:
+    """Keep-alive requests sessions, one per scheme+host, with retry adapters and reuse stats"""
+
+    def __init__(self, pool_size: int = 4):
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get(self, url: str, retry=None) -> requests.Session:
+        """Session for the host of url, created with the given urllib3 Retry on first use"""
+        from requests.adapters import HTTPAdapter
+
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+
+        with self._lock:
+            # Sockets must not be shared with a forked parent, start over in a new process
+            if self._pid != os.getpid():
+                self._sessions = {}
+                self._pid = os.getpid()
+
+            session = self._sessions.get(host_key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry or 0)
+                session.mount(f"{host_key}/", adapter)
+                self._sessions[host_key] = session
+        return session
+
+    def stats(self) -> Dict[str, Dict]:
+        """Requests served and new connections opened per host, with the connection reuse rate"""
+        stats = {}
+        for host_key, session in list(self._sessions.items()):
+            adapter = session.get_adapter(f"{host_key}/")
+            request_count = 0
+            connection_count = 0
+            for pool_key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is not None:
+                    request_count += pool.num_requests
+                    connection_count += pool.num_connections
+            stats[host_key] = {
+                'requests': request_count,
+                'new_connections': connection_count,
+                'reuse_rate': round(1 - connection_count / request_count, 3) if request_count else None
+            }
+        return stats
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+class LLMResponseCache(SQLiteStore):
+    """Content-addressed cache of parsed LLM extractions: in-memory LRU backed by optional SQLite"""
+
+    schema = [
+        'CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)'
+    ]
+    unavailable_message = 'LLM cache database unavailable, using memory only'
+
+    def __init__(self, max_entries: int = 256, ttl: float = 30 * 24 * 3600,
+                 db_path: Optional[Path] = None, max_disk_entries: int = 5000):
+        super().__init__(db_path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self.stats_counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def make_key(text: str, model: str, prompt_version: int) -> str:
+        digest = hashlib.sha256()
+        for part in (model, str(prompt_version), text):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats_counters['memory_hits'] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            db = self._connection()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        'SELECT value, created_at FROM llm_cache WHERE key = ? AND created_at > ?',
+                        (key, now - self.ttl)
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row:
+                    self._remember(key, row[1], row[0])
+                    self.stats_counters['disk_hits'] += 1
+                    return json.loads(row[0])
+
+            self.stats_counters['misses'] += 1
+            return None
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, serialized)
+            self.stats_counters['stores'] += 1
+
+            db = self._connection()
+            if db is not None:
+                try:
+                    db.execute('INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)',
+                               (key, serialized, now))
+                    # Evict expired rows and keep only the newest max_disk_entries
+                    db.execute('DELETE FROM llm_cache WHERE created_at <= ?', (now - self.ttl,))
+                    db.execute(
+                        'DELETE FROM llm_cache WHERE key NOT IN '
+                        '(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT ?)',
+                        (self.max_disk_entries,)
+                    )
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"Could not persist LLM cache entry: {e}", file=sys.stderr)
+
+    def _remember(self, key: str, created_at: float, serialized: str):
+        self._memory[key] = (created_at, serialized)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        hits = self.stats_counters['memory_hits'] + self.stats_counters['disk_hits']
+        lookups = hits + self.stats_counters['misses']
+        return {
+            **self.stats_counters,
+            'memory_entries': len(self._memory),
+            'hit_rate': round(hits / lookups, 3) if lookups else None
+        }
+
+
+def _literal_prefix(source: str) -> Tuple[str, str]:
+    """Split a regex into the literal text it must start with and the remaining pattern"""
+    if re.search(r'(?<!\\)[|(]', source):
+        return '', source
+    prefix = []
+    i = 0
+    while i < len(source):
+        if source[i] == '\\' and i + 1 < len(source) and not source[i + 1].isalnum():
+            char, width = source[i + 1], 2
+        elif source[i].isalnum() or source[i] in ' -:,/':
+            char, width = source[i], 1
+        else:
+            break
+        if source[i + width:i + width + 1] in ('?', '*', '+', '{'):
+            break
+        prefix.append(char)
+        i += width
+    return ''.join(prefix), source[i:]
+
+
+def _trie_regex(node: Dict) -> str:
+    """Regex for a prefix trie built by KeywordMatcher, sharing common prefixes between patterns"""
+    alternatives = [re.escape(char) + _trie_regex(child) for char, child in node.items() if char != '']
+    tails = node.get('', [])
+    alternatives += [f'(?:{tail})' if tail else '' for tail in tails]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+
+class KeywordMatcher:
+    """Keywords or regex fragments compiled into one pattern and scanned in a single pass.
+
+    At each position only the first listed pattern that matches is reported, as a loop of re.search calls would.
+    """
+
+    def __init__(self, patterns: List[str], labels: Optional[List] = None, literal: bool = False, flags: int = 0):
+        self.patterns = list(patterns)
+        self.labels = list(labels) if labels is not None else self.patterns
+        sources = [re.escape(pattern) if literal else pattern for pattern in self.patterns]
+        self._compiled = [re.compile(source, flags) for source in sources]
+        self._ignore_case = bool(flags & re.IGNORECASE)
+
+        trie = {}
+        by_first_char = {}
+        any_first_char = []
+        for index, source in enumerate(sources):
+            prefix, tail = _literal_prefix(source)
+            if self._ignore_case:
+                prefix = prefix.lower()
+            node = trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node.setdefault('', []).append(tail)
+            if prefix:
+                by_first_char.setdefault(prefix[0], []).append(index)
+            else:
+                any_first_char.append(index)
+        self.regex = re.compile(_trie_regex(trie), flags)
+
+        # Patterns that can start at a given character, in list order, to attribute a hit
+        self._any_first_char = any_first_char
+        self._candidates = {char: sorted(indexes + any_first_char) for char, indexes in by_first_char.items()}
+
+    def finditer(self, text: str):
+        """Yield (start, end, pattern index) for every hit in text, in order of position"""
+        position = 0
+        while True:
+            match = self.regex.search(text, position)
+            if match is None:
+                return
+            start = match.start()
+            char = text[start].lower() if self._ignore_case else text[start]
+            for index in self._candidates.get(char, self._any_first_char):
+                candidate = self._compiled[index].match(text, start)
+                if candidate is not None:
+                    yield start, candidate.end(), index
+                    break
+            position = start + 1
+
+    def search(self, text: str) -> bool:
+        return self.regex.search(text) is not None
+
+    def first(self, text: str) -> Optional[Tuple[int, int, int]]:
+        """Earliest hit of the first listed pattern that occurs in text, as (start, end, pattern index)"""
+        best = None
+        for hit in self.finditer(text):
+            if best is None or hit[2] < best[2]:
+                best = hit
+                if hit[2] == 0:
+                    break
+        return best
+
+    def first_label(self, text: str):
+        hit = self.first(text)
+        return self.labels[hit[2]] if hit else None
+
+    def matched_labels(self, text: str) -> List:
+        """Distinct labels found in text, in order of first occurrence"""
+        labels = []
+        for _, _, index in self.finditer(text):
+            if self.labels[index] not in labels:
+                labels.append(self.labels[index])
+        return labels
+
+
+class PatternScanner:
+    """Several overlapping regexes scanned in one pass, with the matches re.findall would return for each.
+
+    Like findall, each pattern resumes only after the end of its own last match.
+    """
+
+    def __init__(self, patterns: List[str], flags: int = 0):
+        self.patterns = list(patterns)
+        self.regex = re.compile('(?=' + '|'.join(f'(?:{pattern})' for pattern in self.patterns) + ')', flags)
+        self._compiled = [re.compile(pattern, flags) for pattern in self.patterns]
+
+    def finditer(self, text: str):
+        """Yield (pattern index, start, end, findall value) in order of position, then pattern index"""
+        resume_at = [0] * len(self._compiled)
+        for hit in self.regex.finditer(text):
+            start = hit.start()
+            for index, compiled in enumerate(self._compiled):
+                if start < resume_at[index]:
+                    continue
+                match = compiled.match(text, start)
+                if match is None:
+                    continue
+                resume_at[index] = match.end()
+                groups = match.groups('')
+                value = match.group() if not groups else groups[0] if len(groups) == 1 else groups
+                yield index, start, match.end(), value
+
+
+class VendorIndex:
+    """Known vendors (supplier table, past vendor_name results) for approximate lookups of OCR'd names.
+
+    Names are matched by trigram Dice similarity after dropping accents, legal forms and spaces.
+    """
+
+    LEGAL_FORM_PATTERN = re.compile(r'\b(s\.?r\.?l\.?|b\.?v\.?|n\.?v\.?|ltd|inc|corp|company|bv|nv|srl|llc|gmbh)\b')
+
+    def __init__(self, entries=()):
+        self.vendors = []  # (canonical name, category)
+        self._exact = {}  # normalized name -> index into _names
+        self._names = []  # (vendor index, trigrams) per indexed name or alias
+        self._postings = {}  # trigram -> indexes into _names
+        for entry in entries:
+            self.add(*entry)
+
+    @classmethod
+    def load(cls, path) -> 'VendorIndex':
+        """Vendors from a CSV file (columns name, category, aliases separated by "|") or a JSON
+        list of {"name", "category", "aliases"} objects"""
+        path = Path(path)
+        with open(path, encoding='utf-8', newline='') as vendor_file:
+            if path.suffix.lower() == '.json':
+                rows = json.load(vendor_file)
+            else:
+                rows = [
+                    dict(row, aliases=[alias for alias in (row.get('aliases') or '').split('|') if alias.strip()])
+                    for row in csv.DictReader(vendor_file)
+                ]
+
+        index = cls()
+        for row in rows:
+            if row.get('name'):
+                index.add(row['name'], row.get('category') or None, row.get('aliases') or ())
+        return index
+
+    @classmethod
+    def normalize(cls, name: str) -> str:
+        name = cls.LEGAL_FORM_PATTERN.sub(' ', unicodedata.normalize('NFKD', name.lower()))
+        return ''.join(char for char in name if char.isalnum() and not unicodedata.combining(char))
+
+    @staticmethod
+    def _trigrams(key: str) -> set:
+        padded = f'  {key} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, name: str, category: Optional[str] = None, aliases=()):
+        """Index a vendor under its name and aliases; the first vendor indexed under a name keeps it"""
+        vendor = len(self.vendors)
+        self.vendors.append((name.strip(), category))
+        for spelling in [name, *aliases]:
+            key = self.normalize(spelling)
+            if not key or key in self._exact:
+                continue
+            trigrams = frozenset(self._trigrams(key))
+            self._exact[key] = len(self._names)
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(len(self._names))
+            self._names.append((vendor, trigrams))
+
+    def __len__(self) -> int:
+        return len(self.vendors)
+
+    def lookup(self, text: str, min_score: float = 0.0) -> Optional[Dict]:
+        """Most similar known vendor as {'vendor', 'score', 'category'}, or None below min_score"""
+        key = self.normalize(text or '')
+        if not key:
+            return None
+
+        if key in self._exact:
+            best_name, best_score = self._exact[key], 1.0
+        else:
+            query = self._trigrams(key)
+            # A name scoring at least min_score shares at least min_shared trigrams with the
+            # query, so it is listed under one of the rarest len(query) - min_shared + 1 of them
+            min_shared = max(1, math.ceil(min(min_score, 1.0) * len(query) / (2 - min(min_score, 1.0)) - 1e-9))
+            rarest = sorted(query, key=lambda trigram: len(self._postings.get(trigram, ())))
+            candidates = set()
+            for trigram in rarest[:len(query) - min_shared + 1]:
+                candidates.update(self._postings.get(trigram, ()))
+
+            best_name, best_score = None, 0.0
+            for name in candidates:
+                trigrams = self._names[name][1]
+                score = 2 * len(query & trigrams) / (len(query) + len(trigrams))
+                # Ties go to the name indexed first
+                if score > best_score or (score == best_score and name < best_name):
+                    best_name, best_score = name, score
+
+        if best_name is None or best_score < min_score:
+            return None
+        vendor, category = self.vendors[self._names[best_name][0]]
+        return {'vendor': vendor, 'score': round(best_score, 3), 'category': category}
+
+
+# Line heuristics shared by ReceiptDocument flags and the parser's single-line helpers
+ADDRESS_PATTERNS = [
+    re.compile(r'\d+[a-z]*\s+[a-z\s]+\d+'),  # House number + street + postal
+    re.compile(r'\b\d{4}\s*[a-z]{2}\b'),  # Dutch postal code
+    re.compile(r'straat|laan|plein|weg|kade|singel'),  # Dutch street terms
+]
+CUSTOMER_KEYWORD_MATCHER = KeywordMatcher(
+    ['klant', 'customer', 'naam', 'name', 'adres', 'address', 'aan:', 'to:'], literal=True
+)
+NUMERIC_LINE_PATTERN = re.compile(r'\d+')
+
+
+class ReceiptDocument:
+    """Immutable, preprocessed OCR lines of one receipt, shared by all rule-based parsers.
+
+    Derived values and per-line flags are computed once, on first use.
+    """
+
+    __slots__ = ('lines', 'stripped', 'lower', 'text', 'combined_text', '_cache')
+
+    def __init__(self, text_lines: List[str]):
+        lines = tuple(text_lines)
+        values = {
+            'lines': lines,
+            'stripped': tuple(line.strip() for line in lines),
+            'lower': tuple(line.lower() for line in lines),
+            'text': '\n'.join(lines),
+            'combined_text': ' '.join(lines),
+            '_cache': {}
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ReceiptDocument is immutable')
+
+    @classmethod
+    def of(cls, document) -> 'ReceiptDocument':
+        """Document for a list of text lines or raw text; an existing document is passed through"""
+        if isinstance(document, cls):
+            return document
+        if isinstance(document, str):
+            return cls(document.split('\n'))
+        return cls(document)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def cached(self, key: str, factory):
+        """Value derived from this document, computed on first use (also for parser-specific flags)"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = factory()
+            return value
+
+    @property
+    def upper(self) -> Tuple[str, ...]:
+        return self.cached('upper', lambda: tuple(line.upper() for line in self.lines))
+
+    @property
+    def combined_lower(self) -> str:
+        return self.cached('combined_lower', self.combined_text.lower)
+
+    @property
+    def address_like(self) -> Tuple[bool, ...]:
+        return self.cached('address_like', lambda: tuple(
+            any(pattern.search(line) for pattern in ADDRESS_PATTERNS) for line in self.lower
+        ))
+
+    @property
+    def customer_like(self) -> Tuple[bool, ...]:
+        return self.cached('customer_like', lambda: tuple(CUSTOMER_KEYWORD_MATCHER.search(line) for line in self.lower))
+
+    @property
+    def numeric_only(self) -> Tuple[bool, ...]:
+        return self.cached('numeric_only', lambda: tuple(
+            NUMERIC_LINE_PATTERN.fullmatch(line) is not None for line in self.stripped
+        ))
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if i % 2 else 1)
+        total += value - 9 if value > 9 else value
+    return total % 10 == 0
+
+
+def _weighted_sum(digits: str, weights) -> int:
+    return sum(int(digit) * weight for digit, weight in zip(digits, weights))
+
+
+def _mod_11_10_valid(digits: str) -> bool:
+    """ISO 7064 MOD 11,10 over all digits including the check digit (DE, HR)"""
+    product = 10
+    for digit in digits[:-1]:
+        product = (2 * ((int(digit) + product) % 10 or 10)) % 11
+    return (11 - product) % 10 == int(digits[-1])
+
+
+def _check_at(number: str) -> bool:
+    if not re.fullmatch(r'U\d{8}', number):
+        return False
+    total = sum(int(d) if i % 2 == 0 else sum(divmod(2 * int(d), 10)) for i, d in enumerate(number[1:8]))
+    return (6 - total) % 10 == int(number[8])
+
+
+def _check_be(number: str) -> bool:
+    if len(number) == 9:
+        number = '0' + number
+    return (bool(re.fullmatch(r'[01]\d{9}', number)) and
+            97 - int(number[:8]) % 97 == int(number[8:]))
+
+
+def _check_bg(number: str) -> bool:
+    if re.fullmatch(r'\d{9}', number):
+        check = _weighted_sum(number, range(1, 9)) % 11
+        if check == 10:
+            check = _weighted_sum(number, range(3, 11)) % 11 % 10
+        return check == int(number[8])
+    if not re.fullmatch(r'\d{10}', number):
+        return False
+    # Ten digits: personal number (EGN), foreigner number (PNF) or other legal entity
+    egn = _weighted_sum(number, (2, 4, 8, 5, 10, 9, 7, 3, 6)) % 11 % 10 == int(number[9])
+    pnf = _weighted_sum(number, (21, 19, 17, 13, 11, 9, 7, 3, 1)) % 10 == int(number[9])
+    other = 11 - _weighted_sum(number, (4, 3, 2, 7, 6, 5, 4, 3, 2)) % 11
+    return egn or pnf or (other != 10 and other % 11 == int(number[9]))
+
+
+def _check_cy(number: str) -> bool:
+    if not re.fullmatch(r'[0-59]\d{7}[A-Z]', number) or number.startswith('12'):
+        return False
+    odd_values = (1, 0, 5, 7, 9, 13, 15, 17, 19, 21)
+    total = sum(odd_values[int(d)] if i % 2 == 0 else int(d) for i, d in enumerate(number[:8]))
+    return chr(ord('A') + total % 26) == number[8]
+
+
+def _check_cz(number: str) -> bool:
+    if re.fullmatch(r'\d{8}', number):
+        if number[0] == '9':
+            return False
+        return (11 - _weighted_sum(number, range(8, 1, -1)) % 11) % 10 == int(number[7])
+    if re.fullmatch(r'\d{10}', number):
+        # Birth number of an individual
+        return int(number) % 11 == 0 or (int(number[:9]) % 11 == 10 and number[9] == '0')
+    # Nine digit birth numbers (before 1954) and special individual numbers carry no simple check digit
+    return bool(re.fullmatch(r'\d{9}', number))
+
+
+def _check_de(number: str) -> bool:
+    return bool(re.fullmatch(r'[1-9]\d{8}', number)) and _mod_11_10_valid(number)
+
+
+def _check_dk(number: str) -> bool:
+    return (bool(re.fullmatch(r'[1-9]\d{7}', number)) and
+            _weighted_sum(number, (2, 7, 6, 5, 4, 3, 2, 1)) % 11 == 0)
+
+
+def _check_ee(number: str) -> bool:
+    return (bool(re.fullmatch(r'10\d{7}', number)) and
+            _weighted_sum(number, (3, 7, 1, 3, 7, 1, 3, 7, 1)) % 10 == 0)
+
+
+def _check_es(number: str) -> bool:
+    if not re.fullmatch(r'[0-9A-Z]\d{7}[0-9A-Z]', number):
+        return False
+    letters = 'TRWAGMYFPDXBNJZSQVHLCKE'
+    first, last = number[0], number[8]
+    if first.isdigit():
+        return letters[int(number[:8]) % 23] == last
+    if first in 'XYZ':
+        return letters[int(str('XYZ'.index(first)) + number[1:8]) % 23] == last
+    if first in 'KLM':
+        return letters[int(number[1:8]) % 23] == last
+    # Legal entities (CIF): check digit or letter over the seven middle digits
+    total = sum(int(d) if i % 2 else sum(divmod(2 * int(d), 10)) for i, d in enumerate(number[1:8]))
+    check = (10 - total % 10) % 10
+    return last in (str(check), 'JABCDEFGHI'[check])
+
+
+def _check_fi(number: str) -> bool:
+    return (bool(re.fullmatch(r'\d{8}', number)) and
+            _weighted_sum(number, (7, 9, 10, 5, 8, 4, 2, 1)) % 11 == 0)
+
+
+def _check_fr(number: str) -> bool:
+    if re.fullmatch(r'\d{9}', number):
+        # Only the SIREN part was captured, check that and leave the key to VIES
+        return _luhn_valid(number)
+    if not re.fullmatch(r'[0-9A-HJ-NP-Z]{2}\d{9}', number):
+        return False
+    if number[:2].isdigit():
+        return int(number[:2]) == (12 + 3 * (int(number[2:]) % 97)) % 97
+    # Newer alphanumeric keys cannot be verified locally
+    return True
+
+
+def _check_gr(number: str) -> bool:
+    if len(number) == 8:
+        number = '0' + number
+    if not re.fullmatch(r'\d{9}', number):
+        return False
+    total = 0
+    for digit in number[:8]:
+        total = total * 2 + int(digit)
+    return total * 2 % 11 % 10 == int(number[8])
+
+
+def _check_hr(number: str) -> bool:
+    return bool(re.fullmatch(r'\d{11}', number)) and _mod_11_10_valid(number)
+
+
+def _check_hu(number: str) -> bool:
+    return (bool(re.fullmatch(r'\d{8}', number)) and
+            _weighted_sum(number, (9, 7, 3, 1, 9, 7, 3, 1)) % 10 == 0)
+
+
+def _check_ie(number: str) -> bool:
+    if re.fullmatch(r'\d[A-Z+*]\d{5}[A-Z]', number):
+        # Old style number, rearranged to the current layout
+        number = '0' + number[2:7] + number[0] + number[7]
+    if not re.fullmatch(r'\d{7}[A-W][AH]?', number):
+        return False
+    total = _weighted_sum(number, range(8, 1, -1))
+    if len(number) == 9:
+        total += 9 * 'WABCDEFGHI'.index(number[8])
+    return 'WABCDEFGHIJKLMNOPQRSTUV'[total % 23] == number[7]
+
+
+def _check_it(number: str) -> bool:
+    return (bool(re.fullmatch(r'\d{11}', number)) and
+            number[:7] != '0000000' and
+            _luhn_valid(number))
+
+
+def _check_lt(number: str) -> bool:
+    if not (re.fullmatch(r'\d{7}1\d', number) or re.fullmatch(r'\d{10}1\d', number)):
+        return False
+    body = number[:-1]
+    check = sum((i % 9 + 1) * int(d) for i, d in enumerate(body)) % 11
+    if check == 10:
+        check = sum(((i + 2) % 9 + 1) * int(d) for i, d in enumerate(body)) % 11
+    return check % 10 == int(number[-1])
+
+
+def _check_lu(number: str) -> bool:
+    return bool(re.fullmatch(r'\d{8}', number)) and int(number[:6]) % 89 == int(number[6:])
+
+
+def _check_lv(number: str) -> bool:
+    if not re.fullmatch(r'\d{11}', number):
+        return False
+    if number[0] > '3':
+        # Legal entity
+        return _weighted_sum(number, (9, 1, 4, 8, 3, 10, 2, 5, 7, 6, 1)) % 11 == 3
+    # Personal codes, the newer ones (starting with 32) have no check digit
+    return True
+
+
+def _check_mt(number: str) -> bool:
+    return (bool(re.fullmatch(r'[1-9]\d{7}', number)) and
+            _weighted_sum(number, (3, 4, 6, 7, 8, 9, 10, 1)) % 37 == 0)
+
+
+def _check_nl(number: str) -> bool:
+    if not re.fullmatch(r'\d{9}B\d{2}', number):
+        return False
+    # Companies use the eleven test on the RSIN, sole traders (since 2020) a mod 97 over the full number
+    eleven_test = (_weighted_sum(number, range(9, 1, -1)) - int(number[8])) % 11 == 0
+    mod_97 = int('2321' + number[:9] + '11' + number[10:]) % 97 == 1
+    return eleven_test or mod_97
+
+
+def _check_pl(number: str) -> bool:
+    return (bool(re.fullmatch(r'\d{10}', number)) and
+            _weighted_sum(number, (6, 5, 7, 2, 3, 4, 5, 6, 7)) % 11 == int(number[9]))
+
+
+def _check_pt(number: str) -> bool:
+    if not re.fullmatch(r'[1-9]\d{8}', number):
+        return False
+    check = 11 - _weighted_sum(number, range(9, 1, -1)) % 11
+    return (0 if check >= 10 else check) == int(number[8])
+
+
+def _check_ro(number: str) -> bool:
+    if not re.fullmatch(r'[1-9]\d{1,9}', number):
+        return False
+    body = number[:-1].zfill(9)
+    return 10 * _weighted_sum(body, (7, 5, 3, 2, 1, 7, 5, 3, 2)) % 11 % 10 == int(number[-1])
+
+
+def _check_se(number: str) -> bool:
+    return bool(re.fullmatch(r'\d{10}01', number)) and _luhn_valid(number[:10])
+
+
+def _check_si(number: str) -> bool:
+    if not re.fullmatch(r'[1-9]\d{7}', number):
+        return False
+    check = 11 - _weighted_sum(number, range(8, 1, -1)) % 11
+    return check != 11 and check % 10 == int(number[7])
+
+
+def _check_sk(number: str) -> bool:
+    return bool(re.fullmatch(r'[1-9]\d[2-47-9]\d{7}', number)) and int(number) % 11 == 0
+
+# Structural and check digit validation per EU member state, keyed like _is_eu_country
+# (EL is the VIES prefix for Greece). Each check takes the number without country prefix.
+VAT_NUMBER_CHECKS = {
+    'AT': _check_at, 'BE': _check_be, 'BG': _check_bg, 'CY': _check_cy, 'CZ': _check_cz,
+    'DE': _check_de, 'DK': _check_dk, 'EE': _check_ee, 'EL': _check_gr, 'ES': _check_es,
+    'FI': _check_fi, 'FR': _check_fr, 'GR': _check_gr, 'HR': _check_hr, 'HU': _check_hu,
+    'IE': _check_ie, 'IT': _check_it, 'LT': _check_lt, 'LU': _check_lu, 'LV': _check_lv,
+    'MT': _check_mt, 'NL': _check_nl, 'PL': _check_pl, 'PT': _check_pt, 'RO': _check_ro,
+    'SE': _check_se, 'SI': _check_si, 'SK': _check_sk,
+}
+
+
+def _vat_checksum_valid(country_code: str, vat_number_only: str) -> Optional[bool]:
+    """Offline check of a VAT number's format and check digits; None when the country has no check"""
+    check = VAT_NUMBER_CHECKS.get(country_code.upper())
+    if check is None:
+        return None
+    return check(re.sub(r'[^0-9A-Z+*]', '', vat_number_only.upper()))
+
+
+# File types accepted when a directory is passed in batch mode (matches the upload route)
+SUPPORTED_INPUT_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.pdf'}
+
+# Bump whenever the extraction prompt changes so cached LLM results are not reused
+LLM_PROMPT_VERSION = 1
 
 class DutchReceiptParser:
     """Parse Dutch receipts and extract structured information with LLM enhancement"""
@@ -25,42 +1390,115 @@ class DutchReceiptParser:
                 'http://host.docker.internal:1235/v1',  # Fallback: WSL2 Docker
             ],
             'model': 'microsoft_-_phi-3.5-mini-instruct',  # Updated model ID
-            'timeout': 3,  # Fast fail if LLM service unavailable, fallback to rules
+            'connect_timeout': 3,  # Fast fail if LLM service unavailable, fallback to rules
+            'timeout': 20,  # Read timeout for a completion until latencies are known
             'max_retries': 2,
-            'enable_caching': True
+            'enable_caching': True,
+            'cache_max_entries': 256,  # In-memory LRU size for cached LLM extractions
+            'cache_ttl': 30 * 24 * 3600,  # Seconds before a cached extraction is recomputed
+            'cache_persist': True,  # Also keep cached extractions in a SQLite file between runs
+            'discovery_cache_ttl': 3600,  # Seconds before the known-good endpoint is re-probed
+            'dispatch_mode': 'sequential',  # 'sequential', 'hedged' (backups after hedge_delay) or 'race' (all at once)
+            'hedge_delay': 0.5,  # Seconds to wait on an endpoint before starting the next one in hedged mode
+            'pool_size': 4,  # Keep-alive connections kept per endpoint host
+            'stream': False,  # Stream completions and stop as soon as the JSON object is complete
+            'tokenizer': 'microsoft/Phi-3.5-mini-instruct',  # tokenizer.json path or Hugging Face id for prompt budgeting
+            'context_tokens': 4096,  # Context length the model is loaded with in LM Studio
+            'completion_tokens': 600,  # Tokens reserved for the generated JSON
+            'batch_max_inflight': 4,  # Parallel LLM requests during batch runs
+            'circuit_failure_threshold': 3,  # Consecutive failures before an endpoint is skipped
+            'circuit_cooldown': 60,  # Seconds before a skipped endpoint is tried (or probed) again
+            'timeout_min': 5,  # Lower bound for timeouts derived from observed p95 latency
+            'timeout_max': 60  # Upper bound for timeouts derived from observed p95 latency
         }
+        self._prompt_overhead_tokens = None
         
-        # Add Windows host IP and mDNS hostname for WSL2 compatibility
-        try:
-            import subprocess
-            
-            # Method 1: Get Windows host via hostname.local (mDNS)
-            hostname_result = subprocess.run(
-                ["hostname"], capture_output=True, text=True, timeout=2
+        # Add Windows host IP and mDNS hostname for WSL2 compatibility, ordered by the last endpoint that answered
+        self.endpoint_discovery = LLMEndpointDiscovery(
+            self.llm_config['endpoints'], ttl=self.llm_config['discovery_cache_ttl']
+        )
+        self.llm_config['endpoints'] = self.endpoint_discovery.ordered_endpoints()
+
+        # Cache of parsed LLM extractions keyed by OCR text, model and prompt version
+        self.llm_cache = None
+        if self.llm_config['enable_caching']:
+            self.llm_cache = LLMResponseCache(
+                max_entries=self.llm_config['cache_max_entries'],
+                ttl=self.llm_config['cache_ttl'],
+                db_path=_cache_dir() / 'llm_cache.sqlite3' if self.llm_config['cache_persist'] else None
             )
-            if hostname_result.returncode == 0:
-                hostname = hostname_result.stdout.strip()
-                self.llm_config['endpoints'].append(f"http://{hostname}.local:1235/v1")
-
-            # Method 2: Get Windows host IP from resolv.conf
-            resolv_result = subprocess.run(
-                ["cat", "/etc/resolv.conf"],
-                capture_output=True, text=True, timeout=2
+
+        # Receipt processing options
+        self.processing_config = {
+            'concurrent_stages': False,  # Run LLM extraction, VIES validation and rule parsing in parallel
+            'vies_deferred': False,  # Return before VIES answers; the VAT decision is looked up by job id later
+            'vies_job_runner': 'thread',  # Deferred jobs run in this process ('thread') or a detached one ('detached')
+            'ocr_batch_size': 8,  # Images per batched predict call and text lines per recognition model batch
+            'llm_batching': True,  # Queue LLM extractions of a batch run and keep several requests in flight
+            'rules_bypass': False,  # Skip the LLM when the rule-based result clears every threshold below
+            'rules_confidence_thresholds': {
+                'vendor_name': 0.85,
+                'total_amount': 0.85,
+                'vat_amount': 0.85,
+                'expense_date': 0.8
+            },
+            'vendor_index_path': os.environ.get('OCR_VENDOR_INDEX'),  # CSV/JSON of known vendors (see VendorIndex.load)
+            'vendor_match_threshold': 0.65  # Minimum trigram similarity (Dice) for a known-vendor match
+        }
+
+        # VIES validation configuration
+        self.vies_config = {
+            'timeout': 8,  # Shorter timeout for background validation
+            'cache_enabled': True,
+            'cache_ttl_valid': 30 * 24 * 3600,  # Registered VAT numbers rarely change
+            'cache_ttl_invalid': 24 * 3600,
+            'cache_ttl_rate_limited': 300,  # Avoid hammering VIES while a member state is overloaded
+            'max_candidates': 4,  # Filtered VAT numbers validated per document
+            'max_concurrent': 4,  # Parallel VIES requests across all member states
+            'rate_limit': 1.0,  # Requests per second per member state
+            'rate_limit_burst': 2,
+            'country_rate_limits': {},  # Per member state overrides of rate_limit, e.g. {'DE': 0.5}
+            'max_attempts': 4,  # Tries per number when VIES is overloaded (MS_MAX_CONCURRENT_REQ or 5xx)
+            'backoff_base': 0.5,  # Seconds, doubled per retry and jittered
+            'backoff_max': 8.0,
+            'job_retention': 7 * 24 * 3600  # Seconds a deferred VIES job stays available for lookup
+        }
+        self.vies_cache = None
+        if self.vies_config['cache_enabled']:
+            self.vies_cache = VIESCache(
+                _cache_dir() / 'vies_cache.sqlite3',
+                ttl_valid=self.vies_config['cache_ttl_valid'],
+                ttl_invalid=self.vies_config['cache_ttl_invalid'],
+                ttl_rate_limited=self.vies_config['cache_ttl_rate_limited']
             )
-            for line in resolv_result.stdout.split('\n'):
-                if 'nameserver' in line:
-                    windows_ip = line.split()[-1]
-                    self.llm_config['endpoints'].append(f"http://{windows_ip}:1235/v1")
-                    break
-        except:
-            pass
-        # Initialize PaddleOCR with Dutch support, disable document unwarping to avoid issues
-        self.ocr = PaddleOCR(
-            use_textline_orientation=True, 
-            lang='en',  # Using english for better number recognition
-            use_doc_unwarping=False,  # Disable document unwarping to avoid axis mismatch error
-            use_doc_orientation_classify=False  # Disable document orientation classification for stability
+
+        # Deferred VIES validations, looked up by job id (see vies_deferred)
+        self.vies_jobs = VIESJobStore(_cache_dir() / 'vies_jobs.sqlite3', retention=self.vies_config['job_retention'])
+        self.vies_jobs_started = 0
+
+        # Rate-limited concurrent VIES client, created on first use in each process
+        self._vies_client = None
+        self._vies_client_pid = None
+
+        # Circuit breaking and adaptive timeouts per LLM endpoint, shared between processes
+        self.endpoint_health = EndpointHealthRegistry(
+            self.llm_config['endpoints'],
+            default_timeout=self.llm_config['timeout'],
+            failure_threshold=self.llm_config['circuit_failure_threshold'],
+            cooldown=self.llm_config['circuit_cooldown'],
+            timeout_min=self.llm_config['timeout_min'],
+            timeout_max=self.llm_config['timeout_max']
         )
+
+        # Keep-alive HTTP sessions per host for LLM and VIES calls
+        self.http_sessions = HTTPSessionPool(self.llm_config['pool_size'])
+
+        # PaddleOCR is loaded on first use (see the ocr property) so text-only work skips the model load
+        self._ocr = None
+
+        # Known-vendor index, loaded on first use (see the vendor_index property)
+        self._vendor_index = None
+        self._vendor_index_path = None
         
         # Dutch VAT rates
         self.vat_rates = [0.06, 0.09, 0.21]
@@ -140,6 +1578,15 @@ class DutchReceiptParser:
             r'factuuradres',
             r'bezorgadres'
         ]
+
+        # Keyword lists above compiled once per parser for single-pass matching
+        self.vendor_matcher = KeywordMatcher(self.vendor_patterns, flags=re.IGNORECASE)
+        # Whole words only, so 'action' in 'transaction' or 'total' in 'totalprijs' is no known vendor
+        self.known_vendor_matcher = KeywordMatcher(
+            [rf'\b(?:{pattern})\b' for pattern in self.vendor_patterns], flags=re.IGNORECASE
+        )
+        self.invoice_indicator_matcher = KeywordMatcher(self.invoice_indicators)
+        self.customer_indicator_matcher = KeywordMatcher(self.customer_indicators)
         
         # Amount patterns (European format) - prioritize EUR amounts and specific patterns
         self.amount_patterns = [
@@ -190,6 +1637,45 @@ class DutchReceiptParser:
             'september': '09', 'oktober': '10', 'november': '11', 'december': '12'
         }
 
+    @property
+    def ocr(self):
+        """PaddleOCR engine, imported and initialized on first access"""
+        if self._ocr is None:
+            from paddleocr import PaddleOCR
+
+            # Initialize PaddleOCR with Dutch support, disable document unwarping to avoid issues
+            self._ocr = PaddleOCR(
+                use_textline_orientation=True, 
+                lang='en',  # Using english for better number recognition
+                use_doc_unwarping=False,  # Disable document unwarping to avoid axis mismatch error
+                use_doc_orientation_classify=False,  # Disable document orientation classification for stability
+                # Batched predict calls only pay off when the models also run the batch's text lines together
+                text_recognition_batch_size=self.processing_config['ocr_batch_size'],
+                textline_orientation_batch_size=self.processing_config['ocr_batch_size']
+            )
+        return self._ocr
+
+    @property
+    def vendor_index(self) -> Optional[VendorIndex]:
+        """Known-vendor index from processing_config['vendor_index_path'], loaded on first access"""
+        path = self.processing_config['vendor_index_path']
+        if path != self._vendor_index_path:
+            self._vendor_index_path = path
+            self._vendor_index = None
+            if path:
+                try:
+                    self._vendor_index = VendorIndex.load(path)
+                    print(f"Loaded {len(self._vendor_index)} known vendors from {path}", file=sys.stderr)
+                except Exception as e:
+                    print(f"Could not load vendor index {path}: {e}", file=sys.stderr)
+        return self._vendor_index
+
+    def match_known_vendor(self, name: str) -> Optional[Dict]:
+        """Closest known vendor as {'vendor', 'score', 'category'} if it clears vendor_match_threshold"""
+        if not name or self.vendor_index is None:
+            return None
+        return self.vendor_index.lookup(name, self.processing_config['vendor_match_threshold'])
+
     def extract_text(self, image_path: str) -> List[Tuple[str, float]]:
         """Extract text from image using PaddleOCR"""
         try:
@@ -199,45 +1685,79 @@ class DutchReceiptParser:
             if not results:
                 return []
             
-            # Extract text and confidence scores from the result object
-            text_results = []
-            for result in results:
-                # Access the OCR results from the result object
-                if hasattr(result, 'json') and result.json:
-                    ocr_data = result.json.get('res', {})
-                    rec_texts = ocr_data.get('rec_texts', [])
-                    rec_scores = ocr_data.get('rec_scores', [])
-                    
-                    # Combine texts with their confidence scores
-                    for text, confidence in zip(rec_texts, rec_scores):
-                        if text and text.strip():  # Only include non-empty text
-                            text_results.append((text.strip(), confidence))
-                
-            return text_results
+            return self._collect_text_results(results)
             
         except Exception as e:
             print(f"Error in OCR extraction: {e}", file=sys.stderr)
             print(f"Image path: {image_path}", file=sys.stderr)
             print(f"Error type: {type(e).__name__}", file=sys.stderr)
-            import traceback
             print(f"Full traceback: {traceback.format_exc()}", file=sys.stderr)
             return []
 
-    def parse_vendor(self, text_lines: List[str]) -> Optional[str]:
+    def _collect_text_results(self, results) -> List[Tuple[str, float]]:
+        """Flatten PaddleOCR result objects into (text, confidence) pairs"""
+        # Extract text and confidence scores from the result object
+        text_results = []
+        for result in results:
+            # Access the OCR results from the result object
+            if hasattr(result, 'json') and result.json:
+                ocr_data = result.json.get('res', {})
+                rec_texts = ocr_data.get('rec_texts', [])
+                rec_scores = ocr_data.get('rec_scores', [])
+                
+                # Combine texts with their confidence scores
+                for text, confidence in zip(rec_texts, rec_scores):
+                    if text and text.strip():  # Only include non-empty text
+                        text_results.append((text.strip(), confidence))
+            
+        return text_results
+
+    def extract_text_batch(self, image_paths: List[str]) -> List[List[Tuple[str, float]]]:
+        """Extract text from several images with one batched PaddleOCR predict call"""
+        try:
+            results = self.ocr.predict(image_paths)
+        except Exception as e:
+            print(f"Batched OCR failed ({e}), falling back to per-image extraction", file=sys.stderr)
+            return [self.extract_text(image_path) for image_path in image_paths]
+
+        # Multi-page PDFs yield one result per page, so group results by their input path
+        grouped = {image_path: [] for image_path in image_paths}
+        for index, result in enumerate(results or []):
+            ocr_data = result.json.get('res', {}) if hasattr(result, 'json') and result.json else {}
+            input_path = ocr_data.get('input_path')
+            if input_path not in grouped:
+                input_path = image_paths[index] if len(results) == len(image_paths) else None
+            if input_path is not None:
+                grouped[input_path].append(result)
+
+        return [self._collect_text_results(grouped[image_path]) for image_path in image_paths]
+
+    def parse_vendor(self, document) -> Optional[str]:
         """Extract vendor/supplier name from receipt using intelligent parsing"""
-        if not text_lines:
+        document = ReceiptDocument.of(document)
+        if not document:
             return None
             
-        combined_text = ' '.join(text_lines).lower()
+        combined_text = document.combined_lower
+        text_lines = document.lines
+        
+        # Step 0: Known vendors from the vendor index, tolerant of OCR noise (closest header line wins)
+        if self.vendor_index is not None:
+            best = None
+            for line in document.stripped[:10]:
+                match = self.match_known_vendor(line)
+                if match and (best is None or match['score'] > best['score']):
+                    best = match
+            if best:
+                return best['vendor']
         
         # Step 1: Look for company names with legal entities (highest priority for business invoices)
-        for i, line in enumerate(text_lines[:8]):  # Check first 8 lines
-            line = line.strip()
+        for i, line in enumerate(document.stripped[:8]):  # Check first 8 lines
             if not line:
                 continue
                 
             # Check for company legal entities (S.R.L., B.V., Ltd, etc.)
-            if re.search(r'\b(s\.?r\.?l\.?|b\.?v\.?|n\.?v\.?|ltd|inc|corp|company|bv|nv|srl|llc|gmbh)\b', line.lower()):
+            if re.search(r'\b(s\.?r\.?l\.?|b\.?v\.?|n\.?v\.?|ltd|inc|corp|company|bv|nv|srl|llc|gmbh)\b', document.lower[i]):
                 return line.title()
                 
             # Check for all-caps company names (common in invoices)
@@ -250,38 +1770,35 @@ class DutchReceiptParser:
                 not 'TOTAL' in line):
                 return line.title()
         
-        # Step 2: Check for known Dutch vendors/service providers
-        for pattern in self.vendor_patterns:
-            match = re.search(pattern, combined_text, re.IGNORECASE)
-            if match:
-                # Capitalize first letters for display
-                vendor = match.group().replace('.', ' ').title()
-                return vendor.strip()
+        # Step 2: Check for known Dutch vendors/service providers (earliest listed vendor wins)
+        hit = self.vendor_matcher.first(combined_text)
+        if hit:
+            # Capitalize first letters for display
+            vendor = combined_text[hit[0]:hit[1]].replace('.', ' ').title()
+            return vendor.strip()
         
         # Step 3: Look for vendor patterns near invoice indicators
-        for i, line in enumerate(text_lines):
-            line_lower = line.lower()
+        for i, line_lower in enumerate(document.lower):
             # If this line contains an invoice indicator
-            if any(re.search(indicator, line_lower) for indicator in self.invoice_indicators):
+            if self.invoice_indicator_matcher.search(line_lower):
                 # Look in previous 3 lines and next 2 lines for vendor name
                 search_start = max(0, i-3)
                 search_end = min(len(text_lines), i+3)
                 for j in range(search_start, search_end):
                     if j == i:  # Skip the invoice indicator line itself
                         continue
-                    candidate = text_lines[j].strip()
+                    candidate = document.stripped[j]
                     if self._is_likely_vendor_name(candidate, text_lines):
                         return candidate.title()
         
         # Step 4: Smart analysis of top section (header area)
         # Look for the most likely vendor in first 10 lines, excluding customer info
-        for i, line in enumerate(text_lines[:10]):
-            line = line.strip()
+        for i, line in enumerate(document.stripped[:10]):
             if not line:
                 continue
                 
             # Skip if this looks like customer/recipient info
-            if self._is_customer_info(line, text_lines, i):
+            if self._is_customer_info(document, i):
                 continue
                 
             # Check if this looks like a vendor name
@@ -289,139 +1806,136 @@ class DutchReceiptParser:
                 return line.title()
         
         # Step 5: Fallback - look for prominent text in header (but smarter than before)
-        for line in text_lines[:5]:
-            line = line.strip()
+        for i, line in enumerate(document.stripped[:5]):
             if (len(line) > 2 and 
-                not self._looks_like_address(line) and 
-                not self._looks_like_customer_info(line) and
-                not re.search(r'^\d+$', line)):  # Not just numbers
+                not document.address_like[i] and 
+                not document.customer_like[i] and
+                not document.numeric_only[i]):  # Not just numbers
                 return line.title()
                 
         return None
 
-    def parse_description(self, text_lines: List[str]) -> Optional[str]:
-        """Extract invoice description/service details"""
-        if not text_lines:
+    # Service/product indicators in parse_description
+    DESCRIPTION_INDICATOR_MATCHER = KeywordMatcher([
+        'beschrijving', 'description', 'omschrijving', 'service', 'dienst',
+        'product', 'artikel', 'item', 'subscription', 'abonnement'
+    ], literal=True)
+
+    # Line filters and clean-up of parse_description candidates
+    SERVICE_LINE_PATTERN = re.compile(r'\b(development|comission|commission|service|consulting|software|design|programming)\b')
+    AMOUNT_LINE_PATTERN = re.compile(r'^\d+[,\.]\d{2}$')
+    DATE_LINE_PATTERN = re.compile(r'^\d{1,2}[-/\.]\d{1,2}[-/\.]\d{2,4}$')
+    NUMBER_LINE_PATTERN = re.compile(r'^\d+$')
+    SERVICE_LINE_DISCLAIMER_PATTERN = re.compile(r'circulates|signature|stamp')
+    INDICATOR_LINE_DISCLAIMER_PATTERN = re.compile(r'circulates|signature|stamp|accordance|fiscal|code')
+    SERVICE_LINE_CLEANUP_PATTERNS = [
+        re.compile(r'^(\d+\s+)'),  # Leading item numbers like "1 "
+        re.compile(r'\s+\d+\.\d{2}.*$'),  # Trailing amounts like "600.00"
+        re.compile(r'\s+(Pcs|pcs|pieces|pc|unit|units).*$'),  # Unit indicators
+    ]
+    INDICATOR_LINE_CLEANUP_PATTERNS = [
+        re.compile(r'^[^a-zA-Z]*'),  # Leading non-letters
+        re.compile(r'[€$]\s*[\d,\.]+.*$'),  # Amounts
+    ]
+    TELECOM_DESCRIPTION_PATTERNS = [re.compile(pattern) for pattern in [
+        r'mobiel.*abonnement', r'mobile.*subscription', r'gsm.*abonnement',
+        r'internet.*abonnement', r'telefoon.*abonnement', r'data.*bundel',
+        r'prepaid.*kaart', r'prepaid.*card', r'bel.*bundel', r'call.*bundle'
+    ]]
+    QUANTITY_LINE_PATTERN = re.compile(r'\d+\s*x\s*\w+')
+    PERIOD_LINE_PATTERN = re.compile(r'(maand|month|jaar|year)')
+
+    # Selection of the best parse_description candidate
+    SERVICE_DESCRIPTION_PATTERN = re.compile(r'\b(development|comission|commission|service|consulting|software|design|programming|game|unity|subscription|abonnement)\b')
+    SERVICE_KEYWORD_PATTERN = re.compile(r'\b(development|comission|commission|game|unity)\b')
+    SERVICE_DISCLAIMER_PATTERN = re.compile(r'circulates|signature|stamp|accordance|fiscal|code|article|paragraph')
+    NON_BUSINESS_PATTERN = re.compile(r'circulates|signature|stamp|accordance|fiscal|code|article|paragraph|sector|b-dul|camera|bl\.|sc\.|ap\.|nr\.|strada|straat')
+
+    def parse_description(self, document) -> Optional[str]:
+        """Extract invoice description/service details
+
+        Candidates are found in one pass over the lines and scored as they come; per selection
+        tier only the best one is kept, ties going to the candidate found first in the order
+        of the former separate passes (service lines, indicator lines, telecom, product lines).
+        """
+        document = ReceiptDocument.of(document)
+        if not document:
             return None
-            
-        combined_text = ' '.join(text_lines).lower()
-        descriptions = []
         
-        # Priority 1: Look for explicit service descriptions in table format
-        for i, line in enumerate(text_lines):
-            line_stripped = line.strip()
+        best = {}
+        
+        def consider(description: str, order: tuple):
+            if len(description) <= 5:
+                return
+            length_key = (-len(description), order)
+            description_lower = description.lower()
+            candidates = [('any', length_key)]
+            # Prefer business descriptions, without addresses and legal disclaimers (only
+            # checked for a candidate that would beat the longest one so far)
+            if ('business' not in best or length_key < best['business'][0]) and \
+                    not self.NON_BUSINESS_PATTERN.search(description_lower):
+                candidates.append(('business', length_key))
+            # Prefer service descriptions, by number of service keywords, then shorter
+            if (self.SERVICE_DESCRIPTION_PATTERN.search(description_lower) and
+                not self.SERVICE_DISCLAIMER_PATTERN.search(description_lower)):
+                keywords = len(self.SERVICE_KEYWORD_PATTERN.findall(description_lower))
+                candidates.append(('service', (-keywords, len(description), order)))
+            for tier, key in candidates:
+                if tier not in best or key < best[tier][0]:
+                    best[tier] = (key, description)
+        
+        indicator_lines = []
+        for i, line_stripped in enumerate(document.stripped):
+            line_lower = document.lower[i]
+            is_amount = self.AMOUNT_LINE_PATTERN.search(line_stripped)
+            is_date = self.DATE_LINE_PATTERN.search(line_stripped)
             
-            # Look for service descriptions that appear to be main items
-            if (re.search(r'\b(development|comission|commission|service|consulting|software|design|programming)\b', line.lower()) and
+            # Explicit service descriptions in table format
+            if (self.SERVICE_LINE_PATTERN.search(line_lower) and
                 len(line_stripped) > 10 and
-                not re.search(r'^\d+[,\.]\d{2}$', line_stripped) and  # Not just amounts
-                not re.search(r'^total', line.lower()) and  # Not total lines
-                not re.search(r'circulates|signature|stamp', line.lower())):  # Not legal disclaimers
-                
-                # Clean the line to extract just the service description
-                # Remove leading numbers and trailing amounts/prices
-                cleaned = re.sub(r'^(\d+\s+)', '', line_stripped)  # Remove leading item numbers like "1 "
-                cleaned = re.sub(r'\s+\d+\.\d{2}.*$', '', cleaned)  # Remove trailing amounts like "600.00"
-                cleaned = re.sub(r'\s+(Pcs|pcs|pieces|pc|unit|units).*$', '', cleaned)  # Remove unit indicators
-                
-                if len(cleaned.strip()) > 5:
-                    descriptions.append(cleaned.strip())
-        
-        # Priority 2: Look for service/product descriptions with indicators
-        description_indicators = [
-            'beschrijving', 'description', 'omschrijving', 'service', 'dienst',
-            'product', 'artikel', 'item', 'subscription', 'abonnement'
-        ]
-        
-        # Extract descriptions from lines with indicators
-        for i, line in enumerate(text_lines):
-            line_lower = line.lower()
+                not is_amount and
+                not line_lower.startswith('total') and
+                not self.SERVICE_LINE_DISCLAIMER_PATTERN.search(line_lower)):
+                cleaned = line_stripped
+                for pattern in self.SERVICE_LINE_CLEANUP_PATTERNS:
+                    cleaned = pattern.sub('', cleaned)
+                consider(cleaned.strip(), (1, i))
             
-            # Check if line contains description indicators
-            for indicator in description_indicators:
-                if indicator in line_lower:
-                    # Look in current line and next few lines for descriptions
-                    for j in range(i, min(len(text_lines), i + 3)):
-                        desc_line = text_lines[j].strip()
-                        
-                        # Skip lines that are too short or look like amounts/dates/legal text
-                        if (len(desc_line) < 3 or 
-                            re.search(r'^\d+[,\.]\d{2}$', desc_line) or  # Amounts
-                            re.search(r'^\d{1,2}[-/\.]\d{1,2}[-/\.]\d{2,4}$', desc_line) or  # Dates
-                            re.search(r'^\d+$', desc_line) or  # Just numbers
-                            re.search(r'circulates|signature|stamp|accordance|fiscal|code', desc_line.lower())):  # Legal disclaimers
-                            continue
-                            
-                        # Clean up description
-                        desc_cleaned = re.sub(r'^[^a-zA-Z]*', '', desc_line)  # Remove leading non-letters
-                        desc_cleaned = re.sub(r'[€$]\s*[\d,\.]+.*$', '', desc_cleaned)  # Remove amounts
-                        
-                        if len(desc_cleaned.strip()) > 5:
-                            descriptions.append(desc_cleaned.strip())
-        
-        # Look for mobile/telecom specific descriptions
-        telecom_patterns = [
-            r'mobiel.*abonnement', r'mobile.*subscription', r'gsm.*abonnement',
-            r'internet.*abonnement', r'telefoon.*abonnement', r'data.*bundel',
-            r'prepaid.*kaart', r'prepaid.*card', r'bel.*bundel', r'call.*bundle'
-        ]
-        
-        for pattern in telecom_patterns:
-            matches = re.finditer(pattern, combined_text)
-            for match in matches:
-                # Get surrounding context
+            # Lines with a description indicator offer themselves and the next two lines
+            if self.DESCRIPTION_INDICATOR_MATCHER.search(line_lower):
+                indicator_lines.append(i)
+            window = [start for start in indicator_lines[-3:] if start >= i - 2]
+            if (window and
+                len(line_stripped) >= 3 and
+                not is_amount and
+                not is_date and
+                not self.NUMBER_LINE_PATTERN.search(line_stripped) and
+                not self.INDICATOR_LINE_DISCLAIMER_PATTERN.search(line_lower)):
+                cleaned = line_stripped
+                for pattern in self.INDICATOR_LINE_CLEANUP_PATTERNS:
+                    cleaned = pattern.sub('', cleaned)
+                consider(cleaned.strip(), (2, window[0], i))
+            
+            # Product lines (quantities, periods or plain descriptive text)
+            if (len(line_stripped) >= 8 and not is_amount and not is_date and
+                (self.QUANTITY_LINE_PATTERN.search(line_lower) or
+                 self.PERIOD_LINE_PATTERN.search(line_lower) or
+                 (len(line_stripped) > 10 and
+                  not document.address_like[i] and
+                  not document.customer_like[i]))):
+                consider(line_stripped, (4, i))
+        
+        # Mobile/telecom descriptions with surrounding context
+        combined_text = document.combined_lower
+        for index, pattern in enumerate(self.TELECOM_DESCRIPTION_PATTERNS):
+            for match in pattern.finditer(combined_text):
                 start = max(0, match.start() - 20)
                 end = min(len(combined_text), match.end() + 20)
-                context = combined_text[start:end].strip()
-                descriptions.append(context.title())
+                consider(combined_text[start:end].strip().title(), (3, index, match.start()))
         
-        # Look for product lines (lines with quantities, products)
-        for line in text_lines:
-            line_stripped = line.strip()
-            # Skip very short lines, amounts, dates
-            if (len(line_stripped) < 8 or
-                re.search(r'^\d+[,\.]\d{2}$', line_stripped) or
-                re.search(r'^\d{1,2}[-/\.]\d{1,2}[-/\.]\d{2,4}$', line_stripped)):
-                continue
-                
-            # Look for lines that might be product descriptions
-            if (re.search(r'\d+\s*x\s*\w+', line_stripped.lower()) or  # Quantity patterns
-                re.search(r'(maand|month|jaar|year)', line_stripped.lower()) or  # Time periods
-                (len(line_stripped) > 10 and 
-                 not self._looks_like_address(line_stripped) and
-                 not self._looks_like_customer_info(line_stripped))):
-                descriptions.append(line_stripped)
-        
-        # Return the best description
-        if descriptions:
-            # Prefer longer, more descriptive entries
-            descriptions = [d for d in descriptions if len(d) > 5]
-            if descriptions:
-                # Priority 1: Look for service/business descriptions
-                service_descriptions = [d for d in descriptions if re.search(r'\b(development|comission|commission|service|consulting|software|design|programming|game|unity|subscription|abonnement)\b', d.lower())]
-                if service_descriptions:
-                    # Remove legal disclaimers from service descriptions
-                    clean_service_descriptions = [d for d in service_descriptions if not re.search(r'circulates|signature|stamp|accordance|fiscal|code|article|paragraph', d.lower())]
-                    if clean_service_descriptions:
-                        # Prefer shorter, cleaner service descriptions over longer generic ones
-                        # Sort by business relevance, then by length
-                        clean_service_descriptions.sort(key=lambda x: (
-                            -len(re.findall(r'\b(development|comission|commission|game|unity)\b', x.lower())),  # More service keywords = higher priority
-                            len(x)  # Among equally relevant, prefer shorter
-                        ))
-                        return clean_service_descriptions[0][:200]
-                
-                # Priority 2: Filter out addresses and legal disclaimers
-                business_descriptions = [d for d in descriptions if not re.search(r'circulates|signature|stamp|accordance|fiscal|code|article|paragraph|sector|b-dul|camera|bl\.|sc\.|ap\.|nr\.|strada|straat', d.lower())]
-                if business_descriptions:
-                    # Return the longest business description
-                    best_desc = max(business_descriptions, key=len)
-                    return best_desc[:200]  # Limit length
-                else:
-                    # Fallback to any description
-                    best_desc = max(descriptions, key=len)
-                    return best_desc[:200]
-                
+        for tier in ('service', 'business', 'any'):
+            if tier in best:
+                return best[tier][1][:200]
         return None
     
     def _is_likely_vendor_name(self, candidate: str, all_lines: List[str]) -> bool:
@@ -466,39 +1980,18 @@ class DutchReceiptParser:
             
         return score >= 2
     
-    def _is_customer_info(self, line: str, all_lines: List[str], line_index: int) -> bool:
+    def _is_customer_info(self, document: 'ReceiptDocument', line_index: int) -> bool:
         """Check if this line is likely customer/recipient information"""
-        line_lower = line.lower()
-        
-        # Direct customer indicators
-        if any(re.search(indicator, line_lower) for indicator in self.customer_indicators):
-            return True
-            
-        # Check context - if previous or next line has customer indicators
-        for i in range(max(0, line_index-1), min(len(all_lines), line_index+2)):
-            if i != line_index:
-                context_line = all_lines[i].lower()
-                if any(re.search(indicator, context_line) for indicator in self.customer_indicators):
-                    return True
-                    
-        return False
-    
-    def _looks_like_address(self, line: str) -> bool:
-        """Check if line looks like an address"""
-        line_lower = line.lower()
-        return (re.search(r'\d+[a-z]*\s+[a-z\s]+\d+', line_lower) or  # House number + street + postal
-                re.search(r'\b\d{4}\s*[a-z]{2}\b', line_lower) or  # Dutch postal code
-                re.search(r'straat|laan|plein|weg|kade|singel', line_lower))  # Dutch street terms
-    
-    def _looks_like_customer_info(self, line: str) -> bool:
-        """Quick check if line looks like customer information"""
-        line_lower = line.lower()
-        return any(keyword in line_lower for keyword in 
-                  ['klant', 'customer', 'naam', 'name', 'adres', 'address', 'aan:', 'to:'])
+        has_indicator = document.cached('customer_indicator', lambda: tuple(
+            self.customer_indicator_matcher.search(line) for line in document.lower
+        ))
 
-    def parse_amounts(self, text_lines: List[str]) -> Dict[str, Optional[float]]:
+        # Direct customer indicators, or the previous or next line has customer indicators
+        return any(has_indicator[max(0, line_index-1):line_index+2])
+    
+    def parse_amounts(self, document) -> Dict[str, Optional[float]]:
         """Extract amounts from receipt"""
-        combined_text = ' '.join(text_lines).lower()
+        combined_text = ReceiptDocument.of(document).combined_lower
         amounts = {
             'total_amount': None,
             'vat_amount': None,
@@ -547,9 +2040,9 @@ class DutchReceiptParser:
             
         return amounts
 
-    def parse_date(self, text_lines: List[str]) -> Optional[str]:
+    def parse_date(self, document) -> Optional[str]:
         """Extract date from receipt with Dutch month name support"""
-        combined_text = ' '.join(text_lines).lower()
+        combined_text = ReceiptDocument.of(document).combined_lower
         
         for pattern in self.date_patterns:
             match = re.search(pattern, combined_text, re.IGNORECASE)
@@ -611,17 +2104,52 @@ class DutchReceiptParser:
         closest_rate = min(self.vat_rates, key=lambda x: abs(x - calculated_rate))
         return closest_rate
 
-    def truncate_ocr_text_for_llm(self, ocr_text: str, max_tokens: int = 3500) -> str:
+    # Priority patterns for key information when choosing which middle lines to keep
+    PRIORITY_PATTERNS = [
+        (re.compile(r'€\s*\d+[.,]\d+'), 50),  # Euro amounts - highest priority
+        (re.compile(r'\d+[.,]\d+\s*€'), 50),  # Euro amounts (different format)  
+        (re.compile(r'total|subtotal'), 40),   # Total lines
+        (re.compile(r'btw|vat|tax'), 30),     # Tax information
+        (re.compile(r'factuur|invoice'), 20), # Invoice identifiers
+        (re.compile(r'datum|date.*\d{4}'), 15), # Dates
+    ]
+    DIGIT_PATTERN = re.compile(r'\d')
+
+    def _token_counter(self):
+        """Token counting function for the configured model, falling back to 1 token per character"""
+        tokenizer = _load_tokenizer(self.llm_config['tokenizer']) if self.llm_config['tokenizer'] else None
+        if tokenizer is None:
+            return len
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def _ocr_token_budget(self, count_tokens) -> int:
+        """Tokens left for OCR text once the prompt template and completion are accounted for"""
+        if count_tokens is len:
+            # Without a tokenizer keep the historical conservative character budget
+            return 3500
+        if self._prompt_overhead_tokens is None:
+            # Chat template adds a few role/separator tokens per message
+            self._prompt_overhead_tokens = sum(
+                count_tokens(message['content']) + 8 for message in self._build_llm_messages('')
+            )
+        return self.llm_config['context_tokens'] - self.llm_config['completion_tokens'] - self._prompt_overhead_tokens
+
+    def truncate_ocr_text_for_llm(self, ocr_text: str, max_tokens: Optional[int] = None) -> str:
         """Intelligently truncate OCR text to fit LLM context while preserving key information"""
-        lines = ocr_text.split('\n')
-        
-        # Conservative estimate: 1 token ≈ 1 char (more aggressive than actual but safer)
-        estimated_tokens = len(ocr_text)
+        count_tokens = self._token_counter()
+        if max_tokens is None:
+            max_tokens = self._ocr_token_budget(count_tokens)
+
+        estimated_tokens = count_tokens(ocr_text)
         
         if estimated_tokens <= max_tokens:
             return ocr_text
             
-        print(f"OCR text too long ({estimated_tokens} estimated tokens), truncating to {max_tokens} tokens", file=sys.stderr)
+        print(f"OCR text too long ({estimated_tokens} tokens), truncating to {max_tokens} tokens", file=sys.stderr)
+
+        lines = ocr_text.split('\n')
+        newline_tokens = max(count_tokens('\n'), 1)
+        line_tokens = [count_tokens(line) for line in lines]
         
         # Simple but effective strategy: Take first 30% and last 15% of lines, fill middle with important lines
         total_lines = len(lines)
@@ -634,33 +2162,20 @@ class DutchReceiptParser:
         footer_count = min(int(total_lines * 0.15), 50)  # Cap at 50 lines  
         footer_lines = lines[-footer_count:] if footer_count > 0 else []
         
-        # Calculate how much space we have left for middle content
         header_text = '\n'.join(header_lines)
         footer_text = '\n'.join(footer_lines)
-        
-        # Reserve space for prompt (~1000 chars) and section separators
-        available_chars = max_tokens - len(header_text) - len(footer_text) - 1200
-        
-        # Find important middle lines (amounts, totals, key info)
         middle_lines = lines[header_count:-footer_count] if footer_count > 0 else lines[header_count:]
-        
-        # Score and select middle lines
-        important_middle = []
-        current_chars = 0
-        
-        # Priority patterns for key information
-        priority_patterns = [
-            (r'€\s*\d+[.,]\d+', 50),  # Euro amounts - highest priority
-            (r'\d+[.,]\d+\s*€', 50),  # Euro amounts (different format)  
-            (r'total|subtotal', 40),   # Total lines
-            (r'btw|vat|tax', 30),     # Tax information
-            (r'factuur|invoice', 20), # Invoice identifiers
-            (r'datum|date.*\d{4}', 15), # Dates
-        ]
+        middle_tokens = line_tokens[header_count:header_count + len(middle_lines)]
+
+        # Space left for middle content after header, footer and the section markers
+        marker_tokens = count_tokens(f"\n\n[... {len(middle_lines)} lines truncated ...]\n\n[... summary ...]\n")
+        available_tokens = (max_tokens - marker_tokens
+                            - sum(line_tokens[:header_count]) - len(header_lines) * newline_tokens
+                            - sum(line_tokens[total_lines - len(footer_lines):]) - len(footer_lines) * newline_tokens)
         
         # Score each line
         scored_lines = []
-        for i, line in enumerate(middle_lines):
+        for line, tokens in zip(middle_lines, middle_tokens):
             score = 0
             line_lower = line.lower().strip()
             
@@ -668,45 +2183,57 @@ class DutchReceiptParser:
                 continue
                 
             # Apply priority scoring
-            for pattern, points in priority_patterns:
-                if re.search(pattern, line_lower):
+            for pattern, points in self.PRIORITY_PATTERNS:
+                if pattern.search(line_lower):
                     score += points
             
             # Basic scoring for lines with numbers
-            if re.search(r'\d', line):
+            if self.DIGIT_PATTERN.search(line):
                 score += 5
                 
-            scored_lines.append((score, line))
+            scored_lines.append((score, line, tokens))
         
-        # Sort by score (highest first) and select lines that fit
+        # Sort by score (highest first) and select lines that fit, counting tokens incrementally
         scored_lines.sort(reverse=True, key=lambda x: x[0])
         
-        for score, line in scored_lines:
-            line_chars = len(line) + 1  # +1 for newline
-            if current_chars + line_chars <= available_chars:
+        important_middle = []
+        current_tokens = 0
+        for score, line, tokens in scored_lines:
+            line_cost = tokens + newline_tokens
+            if current_tokens + line_cost <= available_tokens:
                 important_middle.append(line)
-                current_chars += line_chars
-            if current_chars >= available_chars:
+                current_tokens += line_cost
+            if current_tokens >= available_tokens:
                 break
-        
-        # Combine sections
-        middle_text = '\n'.join(important_middle)
-        
-        if middle_text:
-            truncated = f"{header_text}\n\n[... {len(middle_lines) - len(important_middle)} lines truncated ...]\n{middle_text}\n\n[... summary ...]\n{footer_text}"
-        else:
-            truncated = f"{header_text}\n\n[... {len(middle_lines)} lines truncated ...]\n\n{footer_text}"
-        
-        # Final check - if still too long, aggressively cut header
-        if len(truncated) > max_tokens:
-            # Emergency truncation - just take first 50% of target length
-            emergency_length = max_tokens // 2
-            truncated = ocr_text[:emergency_length] + "\n\n[... text truncated due to length ...]"
+
+        def assemble(middle: List[str]) -> str:
+            middle_text = '\n'.join(middle)
+            if middle_text:
+                return f"{header_text}\n\n[... {len(middle_lines) - len(middle)} lines truncated ...]\n{middle_text}\n\n[... summary ...]\n{footer_text}"
+            return f"{header_text}\n\n[... {len(middle_lines)} lines truncated ...]\n\n{footer_text}"
+
+        truncated = assemble(important_middle)
+
+        # Incremental counts ignore merges across line boundaries, so verify and trim the lowest-scored lines
+        while important_middle and count_tokens(truncated) > max_tokens:
+            important_middle.pop()
+            truncated = assemble(important_middle)
+        
+        # Final check - if header and footer alone are too long, keep as many leading lines as fit
+        if count_tokens(truncated) > max_tokens:
+            suffix = "\n\n[... text truncated due to length ...]"
+            remaining = max_tokens - count_tokens(suffix)
+            kept = []
+            for line, tokens in zip(lines, line_tokens):
+                if tokens + newline_tokens > remaining:
+                    break
+                kept.append(line)
+                remaining -= tokens + newline_tokens
+            truncated = '\n'.join(kept) + suffix
         
         # Debug logging
-        final_length = len(truncated)
         print(f"Truncated OCR: {total_lines} lines -> {len(header_lines)} header + {len(important_middle)} middle + {len(footer_lines)} footer", file=sys.stderr)
-        print(f"Original text: {len(ocr_text)} chars → Truncated: {final_length} chars (target: {max_tokens})", file=sys.stderr)
+        print(f"Original text: {estimated_tokens} tokens → Truncated: {count_tokens(truncated)} tokens (target: {max_tokens})", file=sys.stderr)
         
         return truncated
 
@@ -715,7 +2242,54 @@ class DutchReceiptParser:
         
         # Truncate OCR text to fit within LLM context limits
         truncated_text = self.truncate_ocr_text_for_llm(ocr_text)
-        
+
+        # Skip the LLM entirely when this exact text was already extracted with the same model and prompt
+        cache_key = None
+        if self.llm_cache is not None:
+            cache_key = LLMResponseCache.make_key(truncated_text, self.llm_config['model'], LLM_PROMPT_VERSION)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                print(f"LLM extraction served from cache: {cached.get('vendor_name', 'Unknown vendor')}", file=sys.stderr)
+                return cached
+        
+        payload = {
+            "model": self.llm_config['model'],
+            "messages": self._build_llm_messages(truncated_text),
+            "max_tokens": self.llm_config['completion_tokens'],
+            "temperature": 0.01,  # Very low for consistency
+            "top_p": 0.95
+        }
+
+        # Probe once when there is no fresh known-good endpoint so later runs can skip rediscovery
+        if not self.endpoint_discovery.is_fresh():
+            known_good = self.endpoint_discovery.probe()
+            if known_good:
+                self.llm_config['endpoints'] = self.endpoint_discovery.ordered_endpoints()
+
+        # Skip endpoints whose circuit is open
+        endpoints = self.endpoint_health.available_endpoints(self.llm_config['endpoints'])
+
+        if self.llm_config['dispatch_mode'] in ('hedged', 'race'):
+            parsed = self._dispatch_llm_hedged(payload, endpoints)
+        else:
+            parsed = None
+            # Try multiple endpoints for WSL2/Windows compatibility
+            for endpoint in endpoints:
+                parsed = self._request_llm_completion(endpoint, payload)
+                if parsed:
+                    break
+
+        if parsed:
+            if cache_key is not None:
+                self.llm_cache.put(cache_key, parsed)
+            return parsed
+
+        # If all endpoints failed
+        print("All LLM endpoints failed, falling back to rule-based parsing", file=sys.stderr)
+        return None
+
+    def _build_llm_messages(self, truncated_text: str) -> List[Dict[str, str]]:
+        """Chat messages for the extraction prompt (bump LLM_PROMPT_VERSION when changing them)"""
         # Create chat messages for proper Phi-3.5-mini-instruct format
         system_message = "You are an expert invoice data extraction assistant. Extract structured data from OCR text and return only valid JSON."
         
@@ -746,130 +2320,277 @@ Rules:
 
 Return ONLY the JSON object, no other text."""
 
-        # Try multiple endpoints for WSL2/Windows compatibility
-        for endpoint in self.llm_config['endpoints']:
-            try:
-                print(f"Attempting LLM connection to: {endpoint}", file=sys.stderr)
-                
-                # Call Phi-3.5-mini via LM Studio chat completions API with proper format
-                response = requests.post(
-                    f"{endpoint}/chat/completions",
-                    json={
-                        "model": self.llm_config['model'],
-                        "messages": [
-                            {"role": "system", "content": system_message},
-                            {"role": "user", "content": user_message}
-                        ],
-                        "max_tokens": 600,
-                        "temperature": 0.01,  # Very low for consistency
-                        "top_p": 0.95
-                    },
-                    timeout=self.llm_config['timeout']
-                )
-                
-                if response.status_code == 200:
-                    result_text = response.json()["choices"][0]["message"]["content"]
-                    print(f"Raw LLM response from {endpoint}: {repr(result_text)}", file=sys.stderr)
-                    
-                    # Clean and fix JSON response
-                    result_text = result_text.strip()
-                    
-                    # Extract JSON from verbose LLM response  
-                    json_candidates = []
-                    
-                    # Find all potential JSON objects in the response
-                    start_idx = 0
-                    while True:
-                        start = result_text.find('{', start_idx)
-                        if start == -1:
-                            break
-                            
-                        # Find matching closing brace
-                        brace_count = 0
-                        json_end = 0
-                        for i in range(start, len(result_text)):
-                            char = result_text[i]
-                            if char == '{':
-                                brace_count += 1
-                            elif char == '}':
-                                brace_count -= 1
-                                if brace_count == 0:
-                                    json_end = i + 1
-                                    break
-                        
-                        if json_end > 0:
-                            json_candidate = result_text[start:json_end]
-                            json_candidates.append(json_candidate)
-                            start_idx = json_end
-                        else:
-                            break
-                    
-                    # Try to parse each JSON candidate
-                    for i, json_candidate in enumerate(json_candidates):
-                        try:
-                            # Clean the JSON candidate
-                            lines = json_candidate.split('\n')
-                            clean_lines = []
-                            for line in lines:
-                                # Remove comments
-                                if '//' in line:
-                                    line = line[:line.find('//')]
-                                # Remove markdown code block markers
-                                line = line.replace('```json', '').replace('```', '')
-                                clean_lines.append(line)
-                            
-                            json_clean = '\n'.join(clean_lines).strip()
-                            
-                            # Try to parse
-                            parsed = json.loads(json_clean)
-                            
-                            # Validate it has required fields for invoice data
-                            if (isinstance(parsed, dict) and 
-                                'vendor_name' in parsed and 
-                                ('total_amount' in parsed or 'amount' in parsed)):
-                                
-                                print(f"Successfully parsed JSON candidate {i+1}/{len(json_candidates)} from {endpoint}", file=sys.stderr)
-                                print(f"LLM extraction successful via {endpoint}: {parsed.get('vendor_name', 'Unknown vendor')}", file=sys.stderr)
-                                return parsed
-                            else:
-                                print(f"JSON candidate {i+1} missing required fields", file=sys.stderr)
-                                
-                        except json.JSONDecodeError as e:
-                            print(f"Failed to parse JSON candidate {i+1}: {e}", file=sys.stderr)
-                            continue
-                    
-                    print(f"No valid JSON found in response from {endpoint} (tried {len(json_candidates)} candidates)", file=sys.stderr)
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+
+    def _dispatch_llm_hedged(self, payload: dict, endpoints: List[str]) -> Optional[dict]:
+        """Send the request to the most likely endpoint and start backups after the hedge delay.
+
+        In 'race' mode every endpoint is started at once. The first valid JSON wins and
+        backups that have not started yet are skipped. Attempts always stream, so requests
+        still in flight are hung up on, which stops their generation server-side.
+        """
+        hedge_delay = 0 if self.llm_config['dispatch_mode'] == 'race' else self.llm_config['hedge_delay']
+        results = queue.Queue()
+        cancel_event = threading.Event()
+
+        # No attempt can take longer than this, even if its thread dies without reporting
+        wait_limit = self.llm_config['connect_timeout'] + self.llm_config['timeout_max']
+
+        def launch(endpoint: str):
+            def attempt():
+                parsed = None
+                try:
+                    parsed = self._request_llm_completion(endpoint, payload, cancel_event)
+                finally:
+                    results.put(parsed)
+            threading.Thread(target=attempt, daemon=True).start()
+
+        launched = 0
+        finished = 0
+        try:
+            while finished < len(endpoints):
+                # Start the next endpoint when everything launched so far has failed (or at once when racing)
+                while launched < len(endpoints) and (launched == finished or hedge_delay == 0):
+                    launch(endpoints[launched])
+                    launched += 1
+
+                try:
+                    parsed = results.get(timeout=hedge_delay if launched < len(endpoints) else wait_limit)
+                except queue.Empty:
+                    if launched == len(endpoints):
+                        print(f"No LLM endpoint answered within {wait_limit}s, abandoning hedged requests", file=sys.stderr)
+                        break
+                    # Hedge delay elapsed without an answer: start a backup request
+                    launch(endpoints[launched])
+                    launched += 1
                     continue
-                else:
+
+                finished += 1
+                if parsed:
+                    return parsed
+        finally:
+            cancel_event.set()
+
+        return None
+
+    def _llm_session(self, endpoint: str) -> requests.Session:
+        """Pooled session for an LLM endpoint; max_retries applies to overloaded (429/5xx) responses"""
+        from urllib3.util.retry import Retry
+
+        # Connection failures are not retried: a dead endpoint should fail fast so the next one is tried
+        retry = Retry(
+            total=self.llm_config['max_retries'], connect=0, read=0,
+            status=self.llm_config['max_retries'], status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None, backoff_factor=0.25, raise_on_status=False
+        )
+        return self.http_sessions.get(endpoint, retry)
+
+    def _vies_session(self, vies_url: str) -> requests.Session:
+        """Pooled keep-alive session for the VIES REST API; retries are left to VIESClient"""
+        return self.http_sessions.get(vies_url)
+
+    @property
+    def vies_client(self) -> VIESClient:
+        """VIES client for this process (worker threads do not survive a fork)"""
+        if self._vies_client is None or self._vies_client_pid != os.getpid():
+            self._vies_client = VIESClient(
+                self._query_vies,
+                cache=self.vies_cache,
+                rate=self.vies_config['rate_limit'],
+                burst=self.vies_config['rate_limit_burst'],
+                country_rates=self.vies_config['country_rate_limits'],
+                max_workers=self.vies_config['max_concurrent'],
+                max_attempts=self.vies_config['max_attempts'],
+                backoff_base=self.vies_config['backoff_base'],
+                backoff_max=self.vies_config['backoff_max']
+            )
+            self._vies_client_pid = os.getpid()
+        return self._vies_client
+
+    def close(self):
+        """Release pooled keep-alive connections and VIES threads (for long-running worker and batch processes)"""
+        # Waits for lookups already queued, so in-process deferred VIES jobs still complete
+        if self._vies_client is not None and self._vies_client_pid == os.getpid():
+            self._vies_client.close()
+            self._vies_client = None
+        self.http_sessions.close()
+
+    def _request_llm_completion(self, endpoint: str, payload: dict, cancel_event=None) -> Optional[dict]:
+        """Call one LM Studio endpoint, recording its health and remembering it as known-good when it answers"""
+        # Another request may have taken the half-open trial since the endpoint list was built
+        if not self.endpoint_health.claim(endpoint):
+            return None
+        read_timeout = self.endpoint_health.timeout_for(endpoint)
+        started = time.monotonic()
+        parsed, outcome = self._call_llm_endpoint(
+            endpoint, payload, (self.llm_config['connect_timeout'], read_timeout), cancel_event
+        )
+        if cancel_event is not None and cancel_event.is_set() and not parsed:
+            # Abandoned hedged request, says nothing about the endpoint
+            return None
+
+        # Unusable model output is not the endpoint's fault, only connection and HTTP errors count against it
+        if outcome == 'answered':
+            self.endpoint_health.record(endpoint, True, time.monotonic() - started)
+            self.endpoint_discovery.record_success(endpoint)
+        elif outcome == 'timed_out':
+            # A timeout is a latency sample of at least the timeout, so the adaptive timeout can grow past it
+            self.endpoint_health.record(endpoint, False, read_timeout)
+        else:
+            self.endpoint_health.record(endpoint, False)
+        return parsed
+
+    @staticmethod
+    def _is_read_timeout(error: requests.exceptions.RequestException) -> bool:
+        # With the retry adapter (and while streaming) requests reports read timeouts as a
+        # ConnectionError wrapping urllib3's ReadTimeoutError, possibly inside a MaxRetryError
+        from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+
+        if isinstance(error, requests.exceptions.ReadTimeout):
+            return True
+        cause = error.args[0] if error.args else None
+        if isinstance(cause, MaxRetryError):
+            cause = cause.reason
+        return isinstance(cause, ReadTimeoutError)
+
+    def _call_llm_endpoint(self, endpoint: str, payload: dict, timeout: Tuple[float, float],
+                           cancel_event=None) -> Tuple[Optional[dict], str]:
+        """Call one LM Studio endpoint and return the first JSON object with invoice fields.
+
+        The outcome is 'answered' once the endpoint returned HTTP 200 (usable content or not),
+        'timed_out' when it stopped responding within the read timeout, otherwise 'failed'.
+        """
+        outcome = 'failed'
+        try:
+            print(f"Attempting LLM connection to: {endpoint}", file=sys.stderr)
+
+            # Hedged attempts always stream, so a losing request can be closed instead of generating on
+            stream = self.llm_config['stream'] or cancel_event is not None
+            # Call Phi-3.5-mini via LM Studio chat completions API with proper format
+            response = self._llm_session(endpoint).post(
+                f"{endpoint}/chat/completions",
+                json={**payload, 'stream': True} if stream else payload,
+                timeout=timeout,
+                stream=stream
+            )
+            try:
+                if response.status_code != 200:
                     print(f"LLM API error from {endpoint}: {response.status_code} - {response.text}", file=sys.stderr)
-                    continue  # Try next endpoint
-                    
-            except requests.exceptions.RequestException as e:
-                print(f"LLM connection failed to {endpoint}: {e}", file=sys.stderr)
-                continue  # Try next endpoint
+                    return None, outcome
+
+                outcome = 'answered'
+                if cancel_event is not None and cancel_event.is_set():
+                    return None, outcome
+                if stream:
+                    return self._read_llm_stream(response, endpoint, cancel_event), outcome
+
+                result_text = response.json()["choices"][0]["message"]["content"]
+                print(f"Raw LLM response from {endpoint}: {repr(result_text)}", file=sys.stderr)
+                return self._parse_llm_json(result_text, endpoint), outcome
+            finally:
+                if stream:
+                    # Closing the streamed response drops the connection, which stops generation server-side
+                    response.close()
+
+        except requests.exceptions.RequestException as e:
+            if self._is_read_timeout(e):
+                outcome = 'timed_out'
+            print(f"LLM connection failed to {endpoint}: {e}", file=sys.stderr)
+        except json.JSONDecodeError as e:
+            print(f"LLM returned invalid JSON from {endpoint}: {e}", file=sys.stderr)
+        except Exception as e:
+            print(f"LLM extraction failed from {endpoint}: {e}", file=sys.stderr)
+
+        return None, outcome
+
+    def _read_llm_stream(self, response: requests.Response, endpoint: str, cancel_event=None) -> Optional[dict]:
+        """Read a streamed completion over SSE and stop as soon as a complete invoice JSON object arrives"""
+        result_text = ''
+        brace_count = 0
+        object_start = None
+        for line in response.iter_lines(decode_unicode=True):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content") or ''
+            for char in delta:
+                result_text += char
+                # Track brace depth incrementally to notice when a top-level object closes
+                if char == '{':
+                    if brace_count == 0:
+                        object_start = len(result_text) - 1
+                    brace_count += 1
+                elif char == '}' and brace_count > 0:
+                    brace_count -= 1
+                    if brace_count == 0:
+                        parsed = self._parse_llm_json(result_text[object_start:], endpoint, log_failures=False)
+                        if parsed:
+                            print(f"Stopped LLM stream from {endpoint} after {len(result_text)} chars", file=sys.stderr)
+                            return parsed
+
+        print(f"Raw LLM response from {endpoint}: {repr(result_text)}", file=sys.stderr)
+        return self._parse_llm_json(result_text, endpoint)
+
+    JSON_DECODER = json.JSONDecoder()
+    CODE_FENCE_PATTERN = re.compile(r'```(?:json)?')
+    LINE_COMMENT_PATTERN = re.compile(r'//[^\n]*')
+
+    def _parse_llm_json(self, result_text: str, endpoint: str, log_failures: bool = True) -> Optional[dict]:
+        """Find the first JSON object with invoice fields in a (possibly verbose) LLM response"""
+        # Clean the whole response once: drop markdown code fences and // comments
+        cleaned = self.CODE_FENCE_PATTERN.sub('', result_text)
+        cleaned = self.LINE_COMMENT_PATTERN.sub('', cleaned)
+
+        # Decode each JSON object in a single left-to-right pass
+        candidate_count = 0
+        position = cleaned.find('{')
+        while position != -1:
+            try:
+                parsed, end = self.JSON_DECODER.raw_decode(cleaned, position)
             except json.JSONDecodeError as e:
-                print(f"LLM returned invalid JSON from {endpoint}: {e}", file=sys.stderr)
-                continue  # Try next endpoint
-            except Exception as e:
-                print(f"LLM extraction failed from {endpoint}: {e}", file=sys.stderr)
-                continue  # Try next endpoint
+                if log_failures:
+                    print(f"Failed to parse JSON candidate at offset {position}: {e}", file=sys.stderr)
+                position = cleaned.find('{', position + 1)
+                continue
+
+            candidate_count += 1
+            # Validate it has required fields for invoice data
+            if (isinstance(parsed, dict) and 
+                'vendor_name' in parsed and 
+                ('total_amount' in parsed or 'amount' in parsed)):
+                
+                print(f"Successfully parsed JSON candidate {candidate_count} from {endpoint}", file=sys.stderr)
+                print(f"LLM extraction successful via {endpoint}: {parsed.get('vendor_name', 'Unknown vendor')}", file=sys.stderr)
+                return parsed
+            elif log_failures:
+                print(f"JSON candidate {candidate_count} missing required fields", file=sys.stderr)
+
+            position = cleaned.find('{', end)
         
-        # If all endpoints failed
-        print("All LLM endpoints failed, falling back to rule-based parsing", file=sys.stderr)
+        if log_failures:
+            print(f"No valid JSON found in response from {endpoint} (tried {candidate_count} candidates)", file=sys.stderr)
         return None
 
-    def fallback_rule_parsing(self, text_lines: List[str]) -> dict:
+    def fallback_rule_parsing(self, document) -> dict:
         """Fallback to rule-based parsing if LLM fails"""
         print("Using rule-based fallback parsing", file=sys.stderr)
+        document = ReceiptDocument.of(document)
         
-        vendor = self.parse_vendor(text_lines)
-        amounts = self.parse_amounts(text_lines)
-        receipt_date = self.parse_date(text_lines)
-        description = self.parse_description(text_lines)
+        vendor = self.parse_vendor(document)
+        amounts = self.parse_amounts(document)
+        receipt_date = self.parse_date(document)
+        description = self.parse_description(document)
         
         # Check for reverse charge
-        raw_text = ' '.join(text_lines)
-        reverse_charge_detected = self.detect_reverse_charge_patterns(raw_text)
+        reverse_charge_detected = self.detect_reverse_charge_patterns(document.combined_lower)
         
         # Determine VAT rate and amounts
         if reverse_charge_detected:
@@ -899,29 +2620,36 @@ Return ONLY the JSON object, no other text."""
             'suggested_vat_type': 'reverse_charge' if reverse_charge_detected else 'standard'
         }
 
+    # Official Belastingdienst categorization patterns, earlier categories take precedence
+    EXPENSE_CATEGORIES = {
+        'maaltijden_zakelijk': ['restaurant', 'cafe', 'bistro', 'eetcafe', 'mcdonalds', 'burger king', 'subway'],
+        'reiskosten': ['ns ', 'gvb', 'uber', 'taxi', 'ov-chipkaart', 'train', 'bus'],
+        'kantoorbenodigdheden': ['staples', 'office depot', 'supplies', 'kantoor'],
+        'telefoon_communicatie': ['kpn', 'vodafone', 't-mobile', 'ziggo', 'telecom'],
+        'professionele_diensten': ['consultant', 'advies', 'legal', 'accountant', 'development', 'design', 'it services', 'software', 'commission', 'comission', 'game development', 'programming', 'coding'],
+        'software_ict': ['microsoft', 'adobe', 'software', 'saas', 'license'],
+        'marketing_reclame': ['google ads', 'facebook', 'marketing', 'advertising', 'social media', 'sales commission', 'lead generation'],
+        'afschrijvingen': ['apple', 'dell', 'hp', 'laptop', 'computer', 'equipment'],
+        'verzekeringen': ['insurance', 'verzekering', 'asr', 'aegon']
+    }
+    CATEGORY_MATCHER = KeywordMatcher(
+        [pattern for patterns in EXPENSE_CATEGORIES.values() for pattern in patterns],
+        labels=[category for category, patterns in EXPENSE_CATEGORIES.items() for _ in patterns],
+        literal=True
+    )
+
     def categorize_expense(self, vendor_name: str, description: str = "") -> str:
         """Categorize expense based on vendor name and description using existing patterns"""
         vendor_lower = vendor_name.lower()
         description_lower = description.lower() if description else ""
         combined_text = f"{vendor_lower} {description_lower}"
         
-        # Use official Belastingdienst categorization patterns
-        for category, patterns in {
-            'maaltijden_zakelijk': ['restaurant', 'cafe', 'bistro', 'eetcafe', 'mcdonalds', 'burger king', 'subway'],
-            'reiskosten': ['ns ', 'gvb', 'uber', 'taxi', 'ov-chipkaart', 'train', 'bus'],
-            'kantoorbenodigdheden': ['staples', 'office depot', 'supplies', 'kantoor'],
-            'telefoon_communicatie': ['kpn', 'vodafone', 't-mobile', 'ziggo', 'telecom'],
-            'professionele_diensten': ['consultant', 'advies', 'legal', 'accountant', 'development', 'design', 'it services', 'software', 'commission', 'comission', 'game development', 'programming', 'coding'],
-            'software_ict': ['microsoft', 'adobe', 'software', 'saas', 'license'],
-            'marketing_reclame': ['google ads', 'facebook', 'marketing', 'advertising', 'social media', 'sales commission', 'lead generation'],
-            'afschrijvingen': ['apple', 'dell', 'hp', 'laptop', 'computer', 'equipment'],
-            'verzekeringen': ['insurance', 'verzekering', 'asr', 'aegon']
-        }.items():
-            for pattern in patterns:
-                if pattern in combined_text:
-                    return category
-        
-        return 'overige_zakelijk'
+        # Known vendors carry their own category
+        known_vendor = self.match_known_vendor(vendor_name)
+        if known_vendor and known_vendor['category']:
+            return known_vendor['category']
+        
+        return self.CATEGORY_MATCHER.first_label(combined_text) or 'overige_zakelijk'
 
     def apply_business_logic(self, llm_fields: dict, raw_text: str, vies_results: List[Dict] = None) -> dict:
         """Apply VIES-first business logic for reverse charge determination"""
@@ -1064,132 +2792,149 @@ Return ONLY the JSON object, no other text."""
             'validated_supplier': None
         }
         
+    REVERSE_CHARGE_MATCHER = KeywordMatcher([
+        'reverse charge', 'reverse taxation', 'reverse vat',
+        'btw verlegd', 'verlegde btw', 'btw verlegging'
+    ], literal=True)
+
     def detect_reverse_charge_patterns(self, text: str) -> bool:
         """Detect reverse charge patterns in text as fallback"""
         if not text:
             return False
             
-        text_lower = text.lower()
-        patterns = [
-            'reverse charge', 'reverse taxation', 'reverse vat',
-            'btw verlegd', 'verlegde btw', 'btw verlegging'
-        ]
-        
-        return any(pattern in text_lower for pattern in patterns)
+        return self.REVERSE_CHARGE_MATCHER.search(text.lower())
 
-    def extract_vat_numbers(self, text: str) -> List[Dict[str, str]]:
-        """Extract VAT numbers from OCR text with country detection"""
-        if not text:
+    # EU VAT number patterns - comprehensive coverage
+    VAT_NUMBER_PATTERNS = {
+        'NL': r'\b(?:NL\s?)?(\d{9}B\d{2})\b',  # Netherlands: NL123456789B01
+        'DE': r'\b(?:DE\s?)?(\d{9})\b',        # Germany: DE123456789  
+        'FR': r'\b(?:FR\s?)?\d{2}\s?(\d{9})\b', # France: FR12 123456789
+        'BE': r'\b(?:BE\s?)?(\d{10})\b',       # Belgium: BE0123456789
+        'RO': r'\b(?:RO\s?)?(\d{8,10})\b',     # Romania: RO12345678 (shorter numbers fail the length check)
+        'IT': r'\b(?:IT\s?)?(\d{11})\b',       # Italy: IT12345678901
+        'ES': r'\b(?:ES\s?)?([\dA-Z]\d{7}[\dA-Z])\b', # Spain: ES12345678Z, ESB12345678
+        'PL': r'\b(?:PL\s?)?(\d{10})\b',       # Poland: PL1234567890
+        'CZ': r'\b(?:CZ\s?)?(\d{8,10})\b',     # Czech Republic: CZ12345678
+        'AT': r'\b(?:AT\s?)?(U\d{8})\b',       # Austria: ATU12345678
+    }
+
+    # Additional patterns for common formats
+    GENERIC_VAT_PATTERNS = [
+        r'\b([A-Z]{2}\d{8,12}[A-Z]?\d{0,3})\b',  # Generic EU format
+        r'\btax\s+(?:code|id|number)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
+        r'\bvat\s+(?:number|id)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
+        r'\bbtw\s+(?:nummer|number)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
+        r'\bcif[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
+    ]
+
+    # Country-specific patterns first, generic patterns as fallback
+    VAT_NUMBER_SCANNER = PatternScanner(list(VAT_NUMBER_PATTERNS.values()) + GENERIC_VAT_PATTERNS, re.IGNORECASE)
+    VAT_CLEANUP_PATTERN = re.compile(r'[^\dA-Z]')
+
+    def extract_vat_numbers(self, text) -> List[Dict[str, str]]:
+        """Extract VAT numbers from OCR text (raw text or a ReceiptDocument) with country detection"""
+        document = ReceiptDocument.of(text)
+        if not document.text:
             return []
         
-        vat_numbers = []
-        
-        # EU VAT number patterns - comprehensive coverage
-        vat_patterns = {
-            'NL': r'\b(?:NL\s?)?(\d{9}B\d{2})\b',  # Netherlands: NL123456789B01
-            'DE': r'\b(?:DE\s?)?(\d{9})\b',        # Germany: DE123456789  
-            'FR': r'\b(?:FR\s?)?\d{2}\s?(\d{9})\b', # France: FR12 123456789
-            'BE': r'\b(?:BE\s?)?(\d{10})\b',       # Belgium: BE0123456789
-            'RO': r'\b(?:RO\s?)?(\d{2,10})\b',     # Romania: RO12345678
-            'IT': r'\b(?:IT\s?)?(\d{11})\b',       # Italy: IT12345678901
-            'ES': r'\b(?:ES\s?)?\d{1}\d{7}[\dA-Z]\b', # Spain: ES12345678Z
-            'PL': r'\b(?:PL\s?)?(\d{10})\b',       # Poland: PL1234567890
-            'CZ': r'\b(?:CZ\s?)?(\d{8,10})\b',     # Czech Republic: CZ12345678
-            'AT': r'\b(?:AT\s?)?(U\d{8})\b',       # Austria: ATU12345678
-        }
-        
-        # Additional patterns for common formats
-        generic_patterns = [
-            r'\b([A-Z]{2}\d{8,12}[A-Z]?\d{0,3})\b',  # Generic EU format
-            r'\btax\s+(?:code|id|number)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
-            r'\bvat\s+(?:number|id)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
-            r'\bbtw\s+(?:nummer|number)[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
-            r'\bcif[:,\s]*([A-Z]{2}?\s?\d{8,12}[A-Z]?\d{0,3})\b',
-        ]
-        
-        text_lines = text.split('\n')
+        country_codes = list(self.VAT_NUMBER_PATTERNS)
+        text_lines = document.upper
+        line_countries = self._line_country_indicators(document)
         
-        # Search each line for VAT numbers
-        for line_num, line in enumerate(text_lines):
-            line = line.strip().upper()
-            if not line:
+        # Lines are joined with NUL, which no pattern matches, so no match spans two lines
+        # (\s would match a newline). Uppercasing can change lengths, so line ends are recounted.
+        line_ends = []
+        offset = 0
+        for line in text_lines:
+            offset += len(line) + 1
+            line_ends.append(offset)
+        
+        # One scan over the document, hits in order of position; they are put back in the order of
+        # the former line-by-line, pattern-by-pattern search before removing duplicates
+        hits = []
+        cleaned = {}
+        line_num = -1
+        line_end = 0
+        for pattern_index, start, _, match in self.VAT_NUMBER_SCANNER.finditer('\0'.join(text_lines)):
+            while start >= line_end:
+                line_num += 1
+                line_end = line_ends[line_num]
+            clean_match = cleaned.get(match)
+            if clean_match is None:
+                clean_match = cleaned[match] = self.VAT_CLEANUP_PATTERN.sub('', match.upper())
+            if len(clean_match) < 8:  # Minimum length check
                 continue
-                
-            # Try country-specific patterns first
-            for country_code, pattern in vat_patterns.items():
-                matches = re.findall(pattern, line, re.IGNORECASE)
-                for match in matches:
-                    clean_vat = re.sub(r'[^\dA-Z]', '', match.upper())
-                    if len(clean_vat) >= 8:  # Minimum length check
-                        vat_numbers.append({
-                            'vat_number': f"{country_code}{clean_vat}",
-                            'country_code': country_code,
-                            'raw_match': match,
-                            'line_context': line,
-                            'line_number': line_num + 1,
-                            'extraction_method': 'country_pattern'
-                        })
             
-            # Try generic patterns as fallback
-            for pattern in generic_patterns:
-                matches = re.findall(pattern, line, re.IGNORECASE)
-                for match in matches:
-                    clean_match = re.sub(r'[^\dA-Z]', '', match.upper())
-                    if len(clean_match) >= 8:
-                        # Try to detect country from prefix
-                        country_code = None
-                        if clean_match[:2].isalpha():
-                            country_code = clean_match[:2]
-                            vat_number = clean_match
-                        else:
-                            # No country prefix, try to infer from context
-                            vat_number = clean_match
-                            country_code = self._infer_country_from_context(line, text_lines[max(0, line_num-2):line_num+3])
-                        
-                        if country_code:
-                            vat_numbers.append({
-                                'vat_number': vat_number,
-                                'country_code': country_code,
-                                'raw_match': match,
-                                'line_context': line,
-                                'line_number': line_num + 1,
-                                'extraction_method': 'generic_pattern'
-                            })
+            if pattern_index < len(country_codes):
+                country_code = country_codes[pattern_index]
+                hits.append((line_num, pattern_index, start, f"{country_code}{clean_match}", country_code, match))
+                continue
+            
+            # Generic pattern: detect country from prefix, else infer it from the surrounding lines
+            if clean_match[:2].isalpha():
+                country_code = clean_match[:2]
+            else:
+                window = 0
+                for countries in line_countries[max(0, line_num-2):line_num+3]:
+                    window |= countries
+                country_code = self._first_indicated_country(window)
+            if country_code:
+                hits.append((line_num, pattern_index, start, clean_match, country_code, match))
+        hits.sort(key=lambda hit: hit[:3])
         
         # Remove duplicates while preserving order
         seen = set()
         unique_vat_numbers = []
-        for vat in vat_numbers:
-            vat_key = vat['vat_number']
-            if vat_key not in seen:
-                seen.add(vat_key)
-                unique_vat_numbers.append(vat)
+        for line_num, pattern_index, _, vat_number, country_code, match in hits:
+            if vat_number not in seen:
+                seen.add(vat_number)
+                unique_vat_numbers.append({
+                    'vat_number': vat_number,
+                    'country_code': country_code,
+                    'raw_match': match,
+                    'line_context': text_lines[line_num].strip(),
+                    'line_number': line_num + 1,
+                    'extraction_method': 'country_pattern' if pattern_index < len(country_codes) else 'generic_pattern'
+                })
         
         return unique_vat_numbers
 
-    def _infer_country_from_context(self, line: str, context_lines: List[str]) -> Optional[str]:
-        """Infer country code from surrounding context"""
-        all_text = ' '.join(context_lines).upper()
-        
-        # Country indicators
-        country_indicators = {
-            'NL': ['NETHERLANDS', 'NEDERLAND', 'HOLLAND', 'DUTCH'],
-            'DE': ['GERMANY', 'DEUTSCHLAND', 'GERMAN'],
-            'FR': ['FRANCE', 'FRENCH', 'FRANCAIS'],
-            'BE': ['BELGIUM', 'BELGIE', 'BELGIQUE'],
-            'RO': ['ROMANIA', 'ROMANIAN', 'BUCURESTI', 'BUCHAREST'],
-            'IT': ['ITALY', 'ITALIA', 'ITALIAN'],
-            'ES': ['SPAIN', 'ESPANA', 'SPANISH'],
-            'PL': ['POLAND', 'POLSKA', 'POLISH'],
-            'CZ': ['CZECH', 'CESKA', 'PRAGUE', 'PRAHA'],
-            'AT': ['AUSTRIA', 'ÖSTERREICH', 'AUSTRIAN', 'VIENNA'],
-        }
-        
-        for country_code, indicators in country_indicators.items():
-            if any(indicator in all_text for indicator in indicators):
-                return country_code
-        
-        return None
+    # Country indicators, in priority order
+    COUNTRY_INDICATORS = {
+        'NL': ['NETHERLANDS', 'NEDERLAND', 'HOLLAND', 'DUTCH'],
+        'DE': ['GERMANY', 'DEUTSCHLAND', 'GERMAN'],
+        'FR': ['FRANCE', 'FRENCH', 'FRANCAIS'],
+        'BE': ['BELGIUM', 'BELGIE', 'BELGIQUE'],
+        'RO': ['ROMANIA', 'ROMANIAN', 'BUCURESTI', 'BUCHAREST'],
+        'IT': ['ITALY', 'ITALIA', 'ITALIAN'],
+        'ES': ['SPAIN', 'ESPANA', 'SPANISH'],
+        'PL': ['POLAND', 'POLSKA', 'POLISH'],
+        'CZ': ['CZECH', 'CESKA', 'PRAGUE', 'PRAHA'],
+        'AT': ['AUSTRIA', 'ÖSTERREICH', 'AUSTRIAN', 'VIENNA'],
+    }
+    COUNTRY_INDICATOR_MATCHER = KeywordMatcher(
+        [indicator for indicators in COUNTRY_INDICATORS.values() for indicator in indicators],
+        labels=[1 << bit for bit, indicators in enumerate(COUNTRY_INDICATORS.values()) for _ in indicators],
+        literal=True
+    )
+
+    def _line_country_indicators(self, document: ReceiptDocument) -> Tuple[int, ...]:
+        """Per line, a bit mask of the countries (bit = position in COUNTRY_INDICATORS) it mentions"""
+        def masks():
+            result = []
+            for line in document.upper:
+                mask = 0
+                for country in self.COUNTRY_INDICATOR_MATCHER.matched_labels(line):
+                    mask |= country
+                result.append(mask)
+            return tuple(result)
+
+        return document.cached('country_indicators', masks)
+
+    def _first_indicated_country(self, mask: int) -> Optional[str]:
+        if not mask:
+            return None
+        return list(self.COUNTRY_INDICATORS)[(mask & -mask).bit_length() - 1]
 
     def _is_eu_country(self, country_code: str) -> bool:
         """Check if country code is an EU member state"""
@@ -1204,11 +2949,24 @@ Return ONLY the JSON object, no other text."""
         """Filter VAT numbers to find the most relevant ones for validation"""
         if not vat_numbers:
             return []
-        
-        # Priority scoring system
-        scored_vats = []
-        
+
+        # Index which VAT numbers contain each base number (number without country prefix), so the
+        # duplicate penalty (same digits reported under several countries) is a lookup per candidate
+        base_numbers = [re.sub(r'^[A-Z]{2}', '', vat['vat_number']) for vat in vat_numbers]
+        base_lengths = {len(base_number) for base_number in base_numbers}
+        containing = {}
+        by_number = {}
         for vat in vat_numbers:
+            vat_num = vat['vat_number']
+            by_number.setdefault(vat_num, []).append(vat)
+            substrings = {vat_num[start:start + length] for length in base_lengths
+                          for start in range(len(vat_num) - length + 1)}
+            for substring in substrings:
+                containing[substring] = containing.get(substring, 0) + 1
+
+        # Priority scoring system, keeping the best scoring entry per VAT number
+        best = {}
+        for index, (vat, base_number) in enumerate(zip(vat_numbers, base_numbers)):
             score = 0
             context = vat['line_context'].upper()
             vat_num = vat['vat_number']
@@ -1235,48 +2993,58 @@ Return ONLY the JSON object, no other text."""
             elif country == 'RO' and len(vat_digits) in [8, 9, 10]:
                 score += 15
             
-            # Penalty for duplicate patterns (same number, different country)
-            base_number = re.sub(r'^[A-Z]{2}', '', vat_num)
-            duplicate_penalty = sum(1 for other in vat_numbers 
-                                  if other != vat and base_number in other['vat_number'])
-            score -= duplicate_penalty * 10
-            
-            scored_vats.append((score, vat))
-        
-        # Sort by score (highest first) and return top candidates
-        scored_vats.sort(reverse=True, key=lambda x: x[0])
-        
-        # Remove very low scoring entries (likely false positives)
-        filtered = [vat for score, vat in scored_vats if score >= 20]
-        
-        # Deduplicate by VAT number (keep highest scoring)
-        seen_numbers = set()
-        unique_vats = []
-        for score, vat in scored_vats:
-            vat_num = vat['vat_number']
-            if vat_num not in seen_numbers and score >= 20:
-                seen_numbers.add(vat_num)
-                unique_vats.append(vat)
+            # Penalty for duplicate patterns (same number, different country); identical entries don't count
+            identical = sum(1 for other in by_number[vat_num] if other == vat)
+            score -= (containing.get(base_number, 0) - identical) * 10
+
+            if vat_num not in best or score > best[vat_num][0]:
+                best[vat_num] = (score, index, vat)
         
-        return unique_vats
+        # Remove very low scoring entries (likely false positives), highest score first
+        ranked = sorted((entry for entry in best.values() if entry[0] >= 20), key=lambda entry: (-entry[0], entry[1]))
+        return [vat for _, _, vat in ranked]
 
     def validate_vat_with_vies(self, vat_number: str, country_code: str) -> Optional[Dict]:
         """Validate VAT number using VIES API with rate limiting consideration"""
         try:
-            # Remove country code from VAT number for VIES API
-            vat_number_only = re.sub(f'^{country_code}', '', vat_number, flags=re.IGNORECASE)
-            
+            return self._vies_result(vat_number, country_code, self._submit_vies_lookup(vat_number, country_code))
+        except Exception as e:
+            print(f"VIES validation error for {country_code}{vat_number}: {e}", file=sys.stderr)
+            return None
+
+    def _submit_vies_lookup(self, vat_number: str, country_code: str):
+        """Start (or join) the VIES lookup for a VAT number and return its Future"""
+        # Remove country code from VAT number for VIES API
+        vat_number_only = re.sub(f'^{country_code}', '', vat_number, flags=re.IGNORECASE)
+        return self.vies_client.submit(country_code, vat_number_only)
+
+    @staticmethod
+    def _vies_result(vat_number: str, country_code: str, future) -> Optional[Dict]:
+        """Result of a VIES lookup Future, labelled with the VAT number as it appeared in the document"""
+        result = future.result()
+        if result is None:
+            return None
+        # Lookups are shared between documents, hand each one its own copy
+        result = dict(result, vat_number=vat_number, country_code=country_code)
+        result.setdefault('cached', False)
+        if result['cached']:
+            print(f"VIES validation served from cache: {country_code}{vat_number}", file=sys.stderr)
+        return result
+
+    def _query_vies(self, country_code: str, vat_number_only: str) -> Tuple[Optional[Dict], bool]:
+        """Single VIES REST request; returns the result (None on errors) and whether it is worth retrying"""
+        try:
             print(f"VIES validation: {country_code}{vat_number_only}", file=sys.stderr)
             
             # Use the official VIES REST API
             vies_url = f"https://ec.europa.eu/taxation_customs/vies/rest-api/ms/{country_code}/vat/{vat_number_only}"
             
-            response = requests.get(vies_url, 
+            response = self._vies_session(vies_url).get(vies_url, 
                 headers={
                     'Accept': 'application/json',
                     'User-Agent': 'Dutch-ZZP-Financial-Suite/1.0'
                 },
-                timeout=8  # Shorter timeout for background validation
+                timeout=self.vies_config['timeout']
             )
 
             if response.status_code == 200:
@@ -1286,17 +3054,17 @@ Return ONLY the JSON object, no other text."""
                 print(f"VIES response for {country_code}{vat_number_only}: valid={data.get('isValid', False)}, error={user_error}", file=sys.stderr)
                 
                 # Handle rate limiting gracefully
-                if user_error == 'MS_MAX_CONCURRENT_REQ':
+                if user_error in ('MS_MAX_CONCURRENT_REQ', 'GLOBAL_MAX_CONCURRENT_REQ'):
                     return {
-                        'vat_number': vat_number,
+                        'vat_number': f"{country_code}{vat_number_only}",
                         'country_code': country_code,
                         'valid': None,  # Unknown due to rate limiting
                         'error': 'VIES API rate limit reached',
                         'validation_date': data.get('requestDate')
-                    }
-                
+                    }, True
+
                 return {
-                    'vat_number': vat_number,
+                    'vat_number': f"{country_code}{vat_number_only}",
                     'country_code': country_code,
                     'valid': data.get('isValid', False) == True,
                     'company_name': data.get('name'),
@@ -1304,20 +3072,73 @@ Return ONLY the JSON object, no other text."""
                     'validation_date': data.get('requestDate'),
                     'user_error': user_error,
                     'request_id': data.get('requestIdentifier')
-                }
+                }, False
             else:
                 print(f"VIES API error: {response.status_code} for {country_code}{vat_number_only}", file=sys.stderr)
-                return None
+                return None, response.status_code == 429 or response.status_code >= 500
                 
         except Exception as e:
-            print(f"VIES validation error for {country_code}{vat_number}: {e}", file=sys.stderr)
-            return None
+            print(f"VIES validation error for {country_code}{vat_number_only}: {e}", file=sys.stderr)
+            return None, False
+
+    def process_receipts(self, image_paths: List[str], batch_size: Optional[int] = None):
+        """Process many receipts, running OCR over batches of images; yields (image_path, result)"""
+        batch_size = batch_size or self.processing_config['ocr_batch_size']
+        def extract_fields(ocr_text: str) -> Optional[dict]:
+            try:
+                return self.extract_fields_with_llm(ocr_text)
+            except Exception as e:
+                print(f"Queued LLM extraction failed: {e}", file=sys.stderr)
+                return None
+
+        # LM Studio has no multi-document completion API, so LLM jobs overlap as parallel requests instead
+        llm_executor = None
+        if self.processing_config['llm_batching']:
+            llm_executor = ThreadPoolExecutor(max_workers=self.llm_config['batch_max_inflight'])
+
+        try:
+            for start in range(0, len(image_paths), batch_size):
+                batch = image_paths[start:start + batch_size]
+                existing = [image_path for image_path in batch if Path(image_path).exists()]
+                ocr_batch = dict(zip(existing, self.extract_text_batch(existing))) if existing else {}
+
+                # Start LLM extraction and VIES lookups for the whole OCR batch before post-processing the first receipt
+                llm_futures = {}
+                rule_scorings = {}
+                for image_path, ocr_results in ocr_batch.items():
+                    if not ocr_results:
+                        continue
+                    document = ReceiptDocument([text for text, _ in ocr_results])
+                    self._prefetch_vies_lookups(document)
+                    if llm_executor is not None:
+                        if self.processing_config['rules_bypass']:
+                            rule_scorings[image_path] = self._score_rule_parsing(document, [score for _, score in ocr_results])
+                            if rule_scorings[image_path][2]:
+                                continue
+                        llm_futures[image_path] = llm_executor.submit(extract_fields, document.text)
+
+                for image_path in batch:
+                    if image_path not in ocr_batch:
+                        yield image_path, {
+                            'success': False,
+                            'error': f'Image file not found: {image_path}'
+                        }
+                        continue
+                    yield image_path, self.process_receipt(image_path, ocr_batch[image_path], llm_futures.get(image_path),
+                                                           rule_scorings.get(image_path))
+        finally:
+            if llm_executor is not None:
+                # Extractions queued for receipts the caller no longer wants are dropped
+                llm_executor.shutdown(wait=True, cancel_futures=True)
+            print(f"VIES client: {json.dumps(self.vies_client.stats())}", file=sys.stderr)
 
-    def process_receipt(self, image_path: str) -> Dict:
+    def process_receipt(self, image_path: str, ocr_results: Optional[List[Tuple[str, float]]] = None,
+                        llm_future=None, rule_scoring=None) -> Dict:
         """Process receipt with LLM-enhanced field extraction"""
         try:
             # Stage 1: OCR text extraction (keep current PaddleOCR)
-            ocr_results = self.extract_text(image_path)
+            if ocr_results is None:
+                ocr_results = self.extract_text(image_path)
             if not ocr_results:
                 return {
                     'success': False,
@@ -1327,90 +3148,36 @@ Return ONLY the JSON object, no other text."""
             
             # Get text lines and overall confidence
             text_lines = [result[0] for result in ocr_results]
-            avg_confidence = sum(result[1] for result in ocr_results) / len(ocr_results)
-            raw_text = '\n'.join(text_lines)
-            
-            # Stage 2: LLM field extraction
-            llm_fields = self.extract_fields_with_llm(raw_text)
-            
-            # Stage 3: VAT number extraction and VIES validation
-            extracted_vat_numbers = self.extract_vat_numbers(raw_text)
-            vies_validation_results = []
-            
-            # Filter and validate only the most relevant VAT numbers
-            filtered_vat_numbers = self._filter_relevant_vat_numbers(extracted_vat_numbers)
-            
-            # Validate filtered VAT numbers (max 2 to respect VIES rate limits)
-            for vat_info in filtered_vat_numbers[:2]:
-                vies_result = self.validate_vat_with_vies(vat_info['vat_number'], vat_info['country_code'])
-                if vies_result:
-                    vies_result.update({
-                        'extraction_context': vat_info['line_context'],
-                        'line_number': vat_info['line_number'],
-                        'extraction_method': vat_info['extraction_method']
-                    })
-                    vies_validation_results.append(vies_result)
+            confidence_scores = [result[1] for result in ocr_results]
+            return self._process_text_lines(text_lines, confidence_scores, 'PaddleOCR', llm_future, rule_scoring)
             
-            if llm_fields:
-                # Use LLM extraction results
-                extracted_data = {
-                    'vendor_name': llm_fields.get('vendor_name'),
-                    'expense_date': llm_fields.get('date'),
-                    'description': llm_fields.get('description'),
-                    'amount': llm_fields.get('net_amount'),
-                    'vat_amount': llm_fields.get('vat_amount'),
-                    'vat_rate': llm_fields.get('vat_rate', 0.21),
-                    'total_amount': llm_fields.get('total_amount'),
-                    'currency': llm_fields.get('currency', 'EUR'),
-                    'requires_manual_review': avg_confidence < 0.8
-                }
-                
-                # Apply business logic with VIES validation results
-                business_logic = self.apply_business_logic(llm_fields, raw_text, vies_validation_results)
-                extracted_data.update(business_logic)
-                
-                extraction_method = 'llm'
-                processing_engine = 'PaddleOCR + Phi-3.5-mini'
-                
-            else:
-                # Fallback to rule-based parsing with VIES validation
-                extracted_data = self.fallback_rule_parsing(text_lines)
-                
-                # Apply business logic even for fallback parsing to get VIES validation
-                business_logic = self.apply_business_logic(extracted_data, raw_text, vies_validation_results)
-                extracted_data.update(business_logic)
-                
-                extraction_method = 'rules'
-                processing_engine = 'PaddleOCR + Rules'
-                
-            # Build result
-            result = {
-                'success': True,
-                'confidence': round(avg_confidence, 2),
-                'raw_text': raw_text,
-                'extracted_data': extracted_data,
-                'extraction_method': extraction_method,
-                'ocr_metadata': {
-                    'line_count': len(text_lines),
-                    'processing_engine': processing_engine,
-                    'language': 'nl/en',
-                    'confidence_scores': [result[1] for result in ocr_results]
+        except Exception as e:
+            print(f"Full processing error: {traceback.format_exc()}", file=sys.stderr)
+            return {
+                'success': False,
+                'error': f'Processing failed: {str(e)}',
+                'confidence': 0.0,
+                'debug_info': {
+                    'error_type': type(e).__name__,
+                    'image_path': image_path,
+                    'traceback': traceback.format_exc()
                 }
             }
-            
-            # Add VAT validation results if any were found
-            if extracted_vat_numbers:
-                result['vat_numbers'] = {
-                    'extracted': extracted_vat_numbers,
-                    'vies_validation': vies_validation_results,
-                    'validation_count': len(vies_validation_results),
-                    'total_extracted': len(extracted_vat_numbers)
+
+    def process_text(self, raw_text: str, confidence: float = 1.0) -> Dict:
+        """Run field extraction and VAT validation (stages 2-3) on already extracted OCR text"""
+        try:
+            text_lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
+            if not text_lines:
+                return {
+                    'success': False,
+                    'error': 'No text provided',
+                    'confidence': 0.0
                 }
-            
-            return result
-            
+
+            return self._process_text_lines(text_lines, [confidence] * len(text_lines), 'Text')
+
         except Exception as e:
-            import traceback
             print(f"Full processing error: {traceback.format_exc()}", file=sys.stderr)
             return {
                 'success': False,
@@ -1418,22 +3185,832 @@ Return ONLY the JSON object, no other text."""
                 'confidence': 0.0,
                 'debug_info': {
                     'error_type': type(e).__name__,
-                    'image_path': image_path,
                     'traceback': traceback.format_exc()
                 }
             }
 
-def main():
-    """Main function to process image from command line"""
-    if len(sys.argv) != 2:
+    def score_rule_fields(self, document, confidence_scores: List[float], fields: dict) -> Dict[str, float]:
+        """Per-field confidence (0-1) of a fallback_rule_parsing result.
+
+        Combines the OCR rec_scores of the source lines with agreement between total, VAT
+        and net under self.vat_rates and whether the vendor is a known vendor (built-in
+        Dutch vendors or the vendor index).
+        """
+        document = ReceiptDocument.of(document)
+        lines_lower = document.lower
+        combined_text = document.combined_lower
+        average_score = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
+
+        def line_score(needles: List[str], skip_numeric: bool = False) -> float:
+            scores = [
+                score for line, score in zip(lines_lower, confidence_scores)
+                if any(needle in line for needle in needles) and not (skip_numeric and re.search(r'\d', line))
+            ]
+            return max(scores) if scores else 0.0
+
+        confidence = {}
+
+        # Vendor: only known vendors found on a non-numeric line (so 'total' in an amount line doesn't count)
+        vendor = (fields.get('vendor_name') or '').lower()
+        known_vendor = bool(vendor) and (self.known_vendor_matcher.search(vendor) or self.match_known_vendor(vendor) is not None)
+        vendor_score = line_score([vendor], skip_numeric=True) if vendor else 0.0
+        if known_vendor and not vendor_score and self.vendor_index is not None:
+            # Canonical name from the vendor index: score the header lines it was matched on
+            for line, score in zip(document.stripped[:10], confidence_scores):
+                match = self.match_known_vendor(line)
+                if match and match['vendor'].lower() == vendor:
+                    vendor_score = max(vendor_score, score)
+        confidence['vendor_name'] = round(vendor_score * (1.0 if known_vendor else 0.6), 3)
+
+        # Amounts: explicit VAT that matches a Dutch rate and adds up to the total
+        total = fields.get('total_amount')
+        vat = fields.get('vat_amount')
+        net = fields.get('amount')
+        vat_explicit = any(re.search(pattern, combined_text) for pattern in self.vat_patterns)
+        amounts_agree = (
+            vat_explicit and total and vat is not None and net and
+            abs(net + vat - total) <= 0.02 and
+            any(abs(net * rate - vat) <= 0.02 for rate in self.vat_rates)
+        )
+        if total:
+            total_text = f"{total:.2f}"
+            total_score = line_score([total_text, total_text.replace('.', ',')])
+            confidence['total_amount'] = round(total_score * (1.0 if amounts_agree else 0.6), 3)
+        else:
+            confidence['total_amount'] = 0.0
+        if vat is not None and vat_explicit:
+            vat_text = f"{vat:.2f}"
+            vat_score = line_score([vat_text, vat_text.replace('.', ',')])
+            confidence['vat_amount'] = round(vat_score * (1.0 if amounts_agree else 0.5), 3)
+        else:
+            confidence['vat_amount'] = 0.0
+
+        # Date: labelled dates (factuurdatum, date:) are trusted more than any date-like number
+        if fields.get('expense_date'):
+            labelled_score = line_score(['datum', 'date'])
+            confidence['expense_date'] = round(labelled_score or average_score * 0.8, 3)
+        else:
+            confidence['expense_date'] = 0.0
+
+        return confidence
+
+    def _score_rule_parsing(self, document: 'ReceiptDocument', confidence_scores: List[float]) -> Tuple[dict, Dict[str, float], bool]:
+        """Run rule-based parsing and report whether every field clears its confidence threshold"""
+        fields = self.fallback_rule_parsing(document)
+        confidence = self.score_rule_fields(document, confidence_scores, fields)
+        thresholds = self.processing_config['rules_confidence_thresholds']
+        confident = all(confidence.get(field, 0.0) >= threshold for field, threshold in thresholds.items())
+        if confident:
+            print(f"Rule-based result is confident ({confidence}), skipping LLM", file=sys.stderr)
+        return fields, confidence, confident
+
+    def _vies_candidates(self, extracted_vat_numbers: List[Dict]) -> List[Dict]:
+        """Most relevant VAT numbers worth a VIES lookup, skipping numbers that fail their check digits"""
+        candidates = []
+        rejected = []
+        for vat_info in self._filter_relevant_vat_numbers(extracted_vat_numbers):
+            country_code = vat_info['country_code']
+            vat_number_only = re.sub(f'^{country_code}', '', vat_info['vat_number'], flags=re.IGNORECASE)
+            if _vat_checksum_valid(country_code, vat_number_only) is False:
+                rejected.append(vat_info['vat_number'])
+                continue
+            candidates.append(vat_info)
+            if len(candidates) == self.vies_config['max_candidates']:
+                break
+
+        if rejected:
+            print(f"Skipping VIES for VAT numbers failing their checksum: {', '.join(rejected)}", file=sys.stderr)
+        return candidates
+
+    def _prefetch_vies_lookups(self, document: 'ReceiptDocument'):
+        """Start VIES lookups for a document ahead of post-processing; results are picked up by Stage 3"""
+        try:
+            for vat_info in self._vies_candidates(self.extract_vat_numbers(document)):
+                self._submit_vies_lookup(vat_info['vat_number'], vat_info['country_code'])
+        except Exception as e:
+            print(f"VIES prefetch failed: {e}", file=sys.stderr)
+
+    def _submit_vies_lookups(self, candidates: List[Dict]) -> list:
+        """Start all lookups at once so they run concurrently (VIESClient enforces the VIES rate limits)"""
+        lookups = []
+        for vat_info in candidates:
+            try:
+                lookups.append(self._submit_vies_lookup(vat_info['vat_number'], vat_info['country_code']))
+            except Exception as e:
+                print(f"VIES validation error for {vat_info['vat_number']}: {e}", file=sys.stderr)
+                lookups.append(None)
+        return lookups
+
+    def _collect_vies_results(self, candidates: List[Dict], lookups: list) -> List[Dict]:
+        vies_validation_results = []
+        for vat_info, lookup in zip(candidates, lookups):
+            if lookup is None:
+                continue
+            try:
+                vies_result = self._vies_result(vat_info['vat_number'], vat_info['country_code'], lookup)
+            except Exception as e:
+                print(f"VIES validation error for {vat_info['vat_number']}: {e}", file=sys.stderr)
+                continue
+            if vies_result:
+                vies_result.update({
+                    'extraction_context': vat_info['line_context'],
+                    'line_number': vat_info['line_number'],
+                    'extraction_method': vat_info['extraction_method']
+                })
+                vies_validation_results.append(vies_result)
+        return vies_validation_results
+
+    def _extract_and_validate_vat_numbers(self, document: 'ReceiptDocument') -> Tuple[List[Dict], List[Dict], Optional[str]]:
+        """Stage 3: extract VAT numbers and validate the most relevant ones with VIES.
+
+        With vies_deferred the validation becomes a background job and its id is returned instead of results.
+        """
+        extracted_vat_numbers = self.extract_vat_numbers(document)
+        
+        # Filter and validate only the most relevant VAT numbers that pass the offline checksum
+        candidates = self._vies_candidates(extracted_vat_numbers)
+
+        if candidates and self.processing_config['vies_deferred']:
+            job_id = self._start_vies_job(candidates)
+            if job_id is not None:
+                return extracted_vat_numbers, [], job_id
+
+        return extracted_vat_numbers, self._collect_vies_results(candidates, self._submit_vies_lookups(candidates)), None
+
+    def _start_vies_job(self, candidates: List[Dict]) -> Optional[str]:
+        """Queue VIES validation of candidates in the job store; the VAT decision is stored when it finishes"""
+        in_process = self.processing_config['vies_job_runner'] == 'thread'
+        job_id = self.vies_jobs.create(candidates, claim=in_process)
+        if job_id is None:
+            return None
+        self.vies_jobs_started += 1
+        print(f"VIES validation deferred as job {job_id}", file=sys.stderr)
+
+        if in_process:
+            lookups = self._submit_vies_lookups(candidates)
+            remaining = [len(lookups)]
+            lock = threading.Lock()
+
+            # Finish the job from whichever lookup completes last, without a thread per job
+            def lookup_done(_):
+                with lock:
+                    remaining[0] -= 1
+                    finished = remaining[0] == 0
+                if finished:
+                    self._complete_vies_job(job_id, candidates, lookups)
+
+            for lookup in lookups:
+                if lookup is None:
+                    lookup_done(None)
+                else:
+                    lookup.add_done_callback(lookup_done)
+        return job_id
+
+    def _complete_vies_job(self, job_id: str, candidates: List[Dict], lookups: list):
+        vies_validation_results = self._collect_vies_results(candidates, lookups)
+        self.vies_jobs.complete(job_id, {
+            'vies_validation': vies_validation_results,
+            'vat_decision': self._determine_vat_treatment(vies_validation_results)
+        })
+        print(f"VIES job {job_id} completed", file=sys.stderr)
+
+    def run_pending_vies_jobs(self) -> int:
+        """Validate jobs queued by other processes (see the 'detached' vies_job_runner)"""
+        jobs = self.vies_jobs.claim_pending()
+        started = [(job_id, candidates, self._submit_vies_lookups(candidates)) for job_id, candidates in jobs]
+        for job_id, candidates, lookups in started:
+            self._complete_vies_job(job_id, candidates, lookups)
+        return len(started)
+
+    def _process_text_lines(self, text_lines: List[str], confidence_scores: List[float], text_source: str,
+                            llm_future=None, rule_scoring=None) -> Dict:
+        """Stages 2-3 of receipt processing over OCR text lines.
+
+        llm_future, when given, is a pending LLM extraction for this text and rule_scoring the
+        _score_rule_parsing result already computed for it (see process_receipts).
+        """
+        avg_confidence = sum(confidence_scores) / len(confidence_scores)
+        document = ReceiptDocument(text_lines)
+        raw_text = document.text
+
+        # Easy receipts: skip the LLM entirely when every rule-parsed field is confident
+        rules_bypass = llm_future is None and rule_scoring is None and self.processing_config['rules_bypass']
+        rule_fields, field_confidence, rules_confident = rule_scoring or (None, None, False)
+        llm_fields = None
+
+        if self.processing_config['concurrent_stages']:
+            # Stages 2 and 3 are independent; rule parsing runs alongside VAT validation, both to
+            # decide the bypass and speculatively in case the LLM fails
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                vat_future = executor.submit(self._extract_and_validate_vat_numbers, document)
+                rules_future = None
+                if rules_bypass:
+                    rule_fields, field_confidence, rules_confident = executor.submit(
+                        self._score_rule_parsing, document, confidence_scores
+                    ).result()
+                elif rule_fields is None:
+                    rules_future = executor.submit(self.fallback_rule_parsing, document)
+
+                if not rules_confident:
+                    if llm_future is None:
+                        llm_future = executor.submit(self.extract_fields_with_llm, raw_text)
+                    llm_fields = llm_future.result()
+                extracted_vat_numbers, vies_validation_results, vies_job_id = vat_future.result()
+                if not llm_fields and rules_future is not None:
+                    rule_fields = rules_future.result()
+        else:
+            if rules_bypass:
+                rule_fields, field_confidence, rules_confident = self._score_rule_parsing(document, confidence_scores)
+
+            # Stage 2: LLM field extraction
+            if not rules_confident:
+                llm_fields = llm_future.result() if llm_future is not None else self.extract_fields_with_llm(raw_text)
+            
+            # Stage 3: VAT number extraction and VIES validation
+            extracted_vat_numbers, vies_validation_results, vies_job_id = self._extract_and_validate_vat_numbers(document)
+        
+        if llm_fields:
+            # Use LLM extraction results
+            extracted_data = {
+                'vendor_name': llm_fields.get('vendor_name'),
+                'expense_date': llm_fields.get('date'),
+                'description': llm_fields.get('description'),
+                'amount': llm_fields.get('net_amount'),
+                'vat_amount': llm_fields.get('vat_amount'),
+                'vat_rate': llm_fields.get('vat_rate', 0.21),
+                'total_amount': llm_fields.get('total_amount'),
+                'currency': llm_fields.get('currency', 'EUR'),
+                'requires_manual_review': avg_confidence < 0.8
+            }
+            
+            # Apply business logic with VIES validation results
+            business_logic = self.apply_business_logic(llm_fields, raw_text, vies_validation_results)
+            extracted_data.update(business_logic)
+            
+            extraction_method = 'llm'
+            processing_engine = f'{text_source} + Phi-3.5-mini'
+            
+        else:
+            # Fallback to rule-based parsing with VIES validation
+            extracted_data = rule_fields or self.fallback_rule_parsing(document)
+            
+            if rules_confident:
+                extracted_data['requires_manual_review'] = avg_confidence < 0.8
+            
+            # Apply business logic even for fallback parsing to get VIES validation
+            business_logic = self.apply_business_logic(extracted_data, raw_text, vies_validation_results)
+            extracted_data.update(business_logic)
+            
+            extraction_method = 'rules_confident' if rules_confident else 'rules'
+            processing_engine = f'{text_source} + Rules'
+            
+        # Build result
+        result = {
+            'success': True,
+            'confidence': round(avg_confidence, 2),
+            'raw_text': raw_text,
+            'extracted_data': extracted_data,
+            'extraction_method': extraction_method,
+            'ocr_metadata': {
+                'line_count': len(text_lines),
+                'processing_engine': processing_engine,
+                'language': 'nl/en',
+                'confidence_scores': confidence_scores
+            }
+        }
+
+        if field_confidence is not None and not llm_fields:
+            result['field_confidence'] = field_confidence
+
+        if vies_job_id is not None:
+            # Provisional VAT treatment until the background validation finishes
+            extracted_data.update({
+                'vat_validation_status': 'pending',
+                'vat_validation_message': 'BTW nummer wordt op de achtergrond gevalideerd via VIES',
+                'vat_validation_job_id': vies_job_id
+            })
+        
+        # Add VAT validation results if any were found
+        if extracted_vat_numbers:
+            result['vat_numbers'] = {
+                'extracted': extracted_vat_numbers,
+                'vies_validation': vies_validation_results,
+                'validation_count': len(vies_validation_results),
+                'total_extracted': len(extracted_vat_numbers)
+            }
+        
+        return result
+
+class _JsonArgumentParser(argparse.ArgumentParser):
+    """Argument parser that reports usage errors as JSON on stdout like the rest of the CLI"""
+
+    def error(self, message):
+        print(json.dumps({
+            'success': False,
+            'error': f'Usage: python ocr_processor.py <image_path> ({message})'
+        }))
+        sys.exit(0)
+
+
+def process_image_request(parser: DutchReceiptParser, image_path: str) -> Dict:
+    """Process a single image path and return the payload printed by the CLI"""
+    if not isinstance(image_path, str) or not image_path:
+        return {
+            'success': False,
+            'error': f'image_path must be a non-empty string, got {image_path!r}'
+        }
+
+    # Check if file exists
+    if not Path(image_path).exists():
+        return {
+            'success': False,
+            'error': f'Image file not found: {image_path}'
+        }
+
+    return parser.process_receipt(image_path)
+
+
+def _parse_worker_request(line: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Decode one JSON-lines worker frame into (request, error_response)"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, {'id': None, 'result': {'success': False, 'error': f'Invalid request JSON: {e}'}}
+
+    if not isinstance(request, dict):
+        return None, {'id': None, 'result': {'success': False, 'error': 'Request must be a JSON object'}}
+
+    return request, None
+
+
+def _execute_worker_request(parser: DutchReceiptParser, request: Dict) -> Dict:
+    """Run a process/process_text worker request against a parser"""
+    request_id = request.get('id')
+    command = request.get('command', 'process')
+
+    if command == 'process_text':
+        return {'id': request_id, 'result': parser.process_text(request.get('raw_text') or '')}
+    if command == 'vies_job':
+        return {'id': request_id, 'result': lookup_vies_job(parser, request.get('job_id') or '')}
+    if command != 'process':
+        return {'id': request_id, 'result': {'success': False, 'error': f'Unknown command: {command}'}}
+
+    return {'id': request_id, 'result': process_image_request(parser, request.get('image_path'))}
+
+
+def _handle_worker_request(parser: DutchReceiptParser, line: str) -> Optional[Dict]:
+    """Handle one JSON-lines worker frame, returns None for a shutdown request"""
+    request, error = _parse_worker_request(line)
+    if error:
+        return error
+
+    command = request.get('command', 'process')
+    if command == 'shutdown':
+        return None
+    if command == 'ping':
+        return {'id': request.get('id'), 'result': {'success': True, 'status': 'ready'}}
+
+    # A request that breaks the parser fails on its own instead of taking the worker down
+    try:
+        if command == 'stats':
+            return {'id': request.get('id'), 'result': {
+                'success': True,
+                'http_connections': parser.http_sessions.stats(),
+                'llm_cache': parser.llm_cache.stats() if parser.llm_cache else None,
+                'llm_endpoints': parser.endpoint_health.stats(),
+                'vies_cache': parser.vies_cache.stats() if parser.vies_cache else None,
+                'vies_client': parser.vies_client.stats()
+            }}
+        return _execute_worker_request(parser, request)
+    except Exception as e:
+        return {'id': request.get('id'), 'result': {'success': False, 'error': f'Worker failed: {e}'}}
+
+
+def _read_process_memory(pid: int) -> Dict[str, Optional[int]]:
+    """Read RSS and (when the kernel exposes it) PSS for a process from /proc, in kB"""
+    memory = {'rss_kb': None, 'pss_kb': None}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    memory['rss_kb'] = int(line.split()[1])
+                    break
+        # PSS splits shared copy-on-write pages between the processes mapping them
+        with open(f'/proc/{pid}/smaps_rollup') as rollup:
+            for line in rollup:
+                if line.startswith('Pss:'):
+                    memory['pss_kb'] = int(line.split()[1])
+                    break
+    except (OSError, ValueError):
+        pass
+    return memory
+
+
+def _pool_worker_main(parser: DutchReceiptParser, connection):
+    """Child process loop: run requests received from the pool until told to stop"""
+    # Probe threads start after the fork, the pool parent stays single-threaded so replacements fork cleanly
+    parser.endpoint_health.start_background_probes()
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        try:
+            response = _execute_worker_request(parser, request)
+        except Exception as e:
+            response = {'id': request.get('id'), 'result': {'success': False, 'error': f'Worker failed: {e}'}}
+        connection.send(response)
+    connection.close()
+    parser.close()
+
+
+class OCRWorkerPool:
+    """Fork-after-load process pool sharing one PaddleOCR model copy-on-write.
+
+    A worker that dies is replaced by a fresh fork; the job it was running fails.
+    """
+
+    def __init__(self, parser: DutchReceiptParser, workers: Optional[int] = None):
+        self.parser = parser
+        # Load the model before forking so every worker inherits the same pages
+        parser.ocr
+
+        self._context = multiprocessing.get_context('fork')
+        self.workers = [self._spawn() for _ in range(workers or os.cpu_count() or 1)]
+        self.respawned = 0
+        self.queue = deque()
+
+    def _spawn(self) -> Dict:
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(target=_pool_worker_main, args=(self.parser, child_connection), daemon=True)
+        process.start()
+        child_connection.close()
+        return {'process': process, 'connection': parent_connection, 'job': None, 'completed': 0}
+
+    def _replace(self, index: int):
+        """Reap a worker whose pipe broke and fork a new one in its place"""
+        worker = self.workers[index]
+        worker['connection'].close()
+        worker['process'].join(timeout=1)
+        if worker['process'].is_alive():
+            worker['process'].terminate()
+            worker['process'].join(timeout=1)
+        print(f"OCR worker {worker['process'].pid} exited (code {worker['process'].exitcode}), restarting it",
+              file=sys.stderr)
+        self.workers[index] = self._spawn()
+        self.respawned += 1
+
+    def submit(self, request: Dict):
+        """Queue a worker request and start it if a worker is idle"""
+        self.queue.append(request)
+        self._dispatch()
+
+    def _dispatch(self):
+        for index, worker in enumerate(self.workers):
+            if not self.queue:
+                break
+            if worker['job'] is not None:
+                continue
+            request = self.queue.popleft()
+            try:
+                worker['connection'].send(request)
+            except (BrokenPipeError, OSError):
+                # The worker died while idle: keep the job queued for its replacement
+                self.queue.appendleft(request)
+                self._replace(index)
+                continue
+            worker['job'] = request.get('id')
+
+    def poll(self, timeout: Optional[float] = None) -> List[Dict]:
+        """Collect finished responses, waiting up to timeout seconds for at least one"""
+        # Jobs re-queued after a failed send wait for the replacement worker
+        self._dispatch()
+        busy = {id(w['connection']): index for index, w in enumerate(self.workers) if w['job'] is not None}
+        if not busy:
+            return []
+
+        responses = []
+        for connection in multiprocessing.connection.wait([self.workers[index]['connection'] for index in busy.values()], timeout):
+            index = busy[id(connection)]
+            worker = self.workers[index]
+            try:
+                responses.append(connection.recv())
+            except (EOFError, OSError):
+                responses.append({'id': worker['job'], 'result': {'success': False, 'error': 'OCR worker exited'}})
+                self._replace(index)
+                continue
+            worker['job'] = None
+            worker['completed'] += 1
+
+        self._dispatch()
+        return responses
+
+    def pending(self) -> int:
+        """Number of queued plus in-flight requests"""
+        return len(self.queue) + sum(1 for w in self.workers if w['job'] is not None)
+
+    def stats(self) -> Dict:
+        """Worker count, queue depth and per-worker memory usage"""
+        return {
+            'worker_count': len(self.workers),
+            'queue_depth': len(self.queue),
+            'busy_workers': sum(1 for w in self.workers if w['job'] is not None),
+            'respawned_workers': self.respawned,
+            'parent': {'pid': os.getpid(), **_read_process_memory(os.getpid())},
+            'workers': [
+                {
+                    'pid': w['process'].pid,
+                    'alive': w['process'].is_alive(),
+                    'busy': w['job'] is not None,
+                    'completed': w['completed'],
+                    **_read_process_memory(w['process'].pid)
+                }
+                for w in self.workers
+            ]
+        }
+
+    def close(self):
+        """Stop all workers after their current job"""
+        for worker in self.workers:
+            try:
+                worker['connection'].send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker['process'].join(timeout=5)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+            worker['connection'].close()
+
+
+def run_pool_worker(pool: OCRWorkerPool):
+    """Serve JSON-lines requests on stdin/stdout through a worker pool.
+
+    Responses are written as jobs finish, so they can arrive out of order; match them by id.
+    A {"command": "stats"} frame reports worker count, queue depth and per-worker RSS.
+    """
+    # stdin is read in the main loop rather than a reader thread: a worker forked while another
+    # thread holds the stdin buffer lock deadlocks when multiprocessing closes sys.stdin in the child
+    stdin_fd = sys.stdin.fileno()
+    buffered = b''
+    print(json.dumps({'ready': True, 'pid': os.getpid(), 'workers': len(pool.workers)}), flush=True)
+
+    accepting = True
+    try:
+        while accepting or pool.pending():
+            lines = []
+            if accepting and select.select([stdin_fd], [], [], 0 if pool.pending() else 0.1)[0]:
+                chunk = os.read(stdin_fd, 65536)
+                lines = (buffered + chunk).split(b'\n')
+                buffered = lines.pop() if chunk else b''
+                accepting = bool(chunk)
+
+            for line in lines:
+                line = line.decode('utf-8', errors='replace')
+                if not line.strip():
+                    continue
+
+                request, error = _parse_worker_request(line)
+                if error:
+                    print(json.dumps(error), flush=True)
+                    continue
+
+                command = request.get('command', 'process')
+                if command == 'shutdown':
+                    accepting = False
+                    break
+                elif command == 'ping':
+                    print(json.dumps({'id': request.get('id'), 'result': {'success': True, 'status': 'ready'}}), flush=True)
+                elif command == 'stats':
+                    print(json.dumps({'id': request.get('id'), 'result': {'success': True, **pool.stats()}}), flush=True)
+                else:
+                    pool.submit(request)
+
+            for response in pool.poll(timeout=0.1):
+                print(json.dumps(response, ensure_ascii=False), flush=True)
+    finally:
+        pool.close()
+
+
+def run_worker(parser: DutchReceiptParser, socket_path: Optional[str] = None):
+    """Serve OCR requests from a warm parser over stdin/stdout or a Unix socket.
+
+    Frames are JSON lines: {"id": ..., "image_path": ...} in, {"id": ..., "result": {...}} out,
+    where result is the same payload the single-image CLI prints. Diagnostics stay on stderr.
+    """
+    # Load the OCR model before announcing readiness so the first request is warm too
+    parser.ocr
+    parser.endpoint_health.start_background_probes()
+
+    if socket_path:
+        _run_socket_worker(parser, socket_path)
+        return
+
+    print(json.dumps({'ready': True, 'pid': os.getpid()}), flush=True)
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            response = _handle_worker_request(parser, line)
+            if response is None:
+                break
+            print(json.dumps(response, ensure_ascii=False), flush=True)
+    finally:
+        parser.close()
+
+
+def _run_socket_worker(parser: DutchReceiptParser, socket_path: str):
+    """Unix socket variant of run_worker, one client connection at a time"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    print(json.dumps({'ready': True, 'pid': os.getpid(), 'socket': socket_path}), flush=True)
+
+    try:
+        running = True
+        while running:
+            connection, _ = server.accept()
+            with connection, connection.makefile('rw', encoding='utf-8') as stream:
+                for line in stream:
+                    if not line.strip():
+                        continue
+                    response = _handle_worker_request(parser, line)
+                    if response is None:
+                        running = False
+                        break
+                    stream.write(json.dumps(response, ensure_ascii=False) + '\n')
+                    stream.flush()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        parser.close()
+
+
+def _resolve_batch_inputs(image_paths: List[str], manifest_path: Optional[str] = None) -> List[str]:
+    """Expand CLI paths, directories and a manifest file into an ordered list of images"""
+    candidates = list(image_paths)
+    if manifest_path:
+        for line in Path(manifest_path).read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                candidates.append(line)
+
+    resolved = []
+    for candidate in candidates:
+        path = Path(candidate)
+        if path.is_dir():
+            resolved.extend(
+                str(child) for child in sorted(path.rglob('*'))
+                if child.is_file() and child.suffix.lower() in SUPPORTED_INPUT_EXTENSIONS
+            )
+        else:
+            resolved.append(candidate)
+    return resolved
+
+
+def run_batch(parser: DutchReceiptParser, image_paths: List[str], batch_size: int = 8):
+    """Process many images in one invocation, writing one NDJSON line per input"""
+    # Set before the OCR model loads, it is created with this recognition batch size
+    parser.processing_config['ocr_batch_size'] = batch_size
+    parser.endpoint_health.start_background_probes()
+    try:
+        for image_path, result in parser.process_receipts(image_paths, batch_size):
+            print(json.dumps({'image_path': image_path, 'result': result}, ensure_ascii=False), flush=True)
+
+        print(f"HTTP connection reuse: {json.dumps(parser.http_sessions.stats())}", file=sys.stderr)
+        if parser.llm_cache:
+            print(f"LLM cache: {json.dumps(parser.llm_cache.stats())}", file=sys.stderr)
+        if parser.vies_cache:
+            print(f"VIES cache: {json.dumps(parser.vies_cache.stats())}", file=sys.stderr)
+    finally:
+        parser.close()
+
+
+def run_text_mode(parser: DutchReceiptParser, text_path: str, confidence: float = 1.0):
+    """Process raw OCR text from a file or stdin without loading PaddleOCR"""
+    if text_path == '-':
+        raw_text = sys.stdin.read()
+    elif Path(text_path).exists():
+        raw_text = Path(text_path).read_text(encoding='utf-8')
+    else:
         print(json.dumps({
             'success': False,
-            'error': 'Usage: python ocr_processor.py <image_path>'
+            'error': f'Text file not found: {text_path}'
         }))
         return
-        
-    image_path = sys.argv[1]
-    
+
+    result = parser.process_text(raw_text, confidence)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def lookup_vies_job(parser: DutchReceiptParser, job_id: str) -> Dict:
+    """Status of a deferred VIES validation, with the VAT decision once it has completed"""
+    job = parser.vies_jobs.get(job_id)
+    if job is None:
+        return {'success': False, 'error': f'Unknown VIES job: {job_id}'}
+    return {'success': True, **job}
+
+
+def _spawn_vies_job_runner():
+    """Finish deferred VIES jobs in a detached process so this one can exit right after its output"""
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), '--run-vies-jobs'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def main():
+    """Main function to process image from command line"""
+    arg_parser = _JsonArgumentParser(description='PaddleOCR receipt processing')
+    arg_parser.add_argument('image_paths', nargs='*', metavar='image_path',
+                            help='Receipt images or directories of receipts to process')
+    arg_parser.add_argument('--manifest', help='File listing one image path per line to process as a batch')
+    arg_parser.add_argument('--batch-size', type=int, default=8,
+                            help='Images per batched OCR predict call and text lines per recognition batch in batch mode (default: 8)')
+    arg_parser.add_argument('--worker', action='store_true',
+                            help='Keep the parser warm and serve JSON-lines requests on stdin/stdout')
+    arg_parser.add_argument('--socket', dest='socket_path',
+                            help='Serve worker requests on this Unix socket instead of stdin/stdout')
+    arg_parser.add_argument('--text', dest='text_path',
+                            help='Skip OCR and extract fields from raw OCR text in this file ("-" for stdin)')
+    arg_parser.add_argument('--confidence', type=float, default=1.0,
+                            help='OCR confidence to report for --text input (default: 1.0)')
+    arg_parser.add_argument('--pool', type=int, metavar='N',
+                            help='Serve worker requests from N forked processes sharing one loaded OCR model')
+    arg_parser.add_argument('--llm-dispatch', choices=['sequential', 'hedged', 'race'],
+                            help='How LLM endpoints are tried: one after another, hedged backups, or all at once')
+    arg_parser.add_argument('--llm-stream', action='store_true',
+                            help='Stream LLM completions and stop once the JSON object is complete')
+    arg_parser.add_argument('--concurrent', action='store_true',
+                            help='Run LLM extraction, VIES validation and rule parsing concurrently per receipt')
+    arg_parser.add_argument('--defer-vies', action='store_true',
+                            help='Return before VIES validation finishes; look the VAT decision up with --vies-job')
+    arg_parser.add_argument('--vies-job', dest='vies_job_id', metavar='JOB_ID',
+                            help='Print the status and VAT decision of a deferred VIES validation')
+    arg_parser.add_argument('--run-vies-jobs', action='store_true', help=argparse.SUPPRESS)
+    arg_parser.add_argument('--rules-bypass', action='store_true',
+                            help='Skip the LLM for receipts whose rule-based fields are all confident')
+    arg_parser.add_argument('--vendor-index', metavar='PATH',
+                            help='CSV or JSON file of known vendors for OCR-tolerant vendor and category lookups')
+    args = arg_parser.parse_args()
+
+    def create_parser() -> DutchReceiptParser:
+        parser = DutchReceiptParser()
+        if args.concurrent:
+            parser.processing_config['concurrent_stages'] = True
+        if args.llm_dispatch:
+            parser.llm_config['dispatch_mode'] = args.llm_dispatch
+        if args.llm_stream:
+            parser.llm_config['stream'] = True
+        if args.defer_vies:
+            parser.processing_config['vies_deferred'] = True
+        if args.rules_bypass:
+            parser.processing_config['rules_bypass'] = True
+        if args.vendor_index:
+            parser.processing_config['vendor_index_path'] = args.vendor_index
+        return parser
+
+    if args.vies_job_id:
+        print(json.dumps(lookup_vies_job(DutchReceiptParser(), args.vies_job_id), ensure_ascii=False, indent=2))
+        return
+
+    if args.run_vies_jobs:
+        DutchReceiptParser().run_pending_vies_jobs()
+        return
+
+    if args.pool:
+        run_pool_worker(OCRWorkerPool(create_parser(), args.pool))
+        return
+
+    if args.worker or args.socket_path:
+        run_worker(create_parser(), args.socket_path)
+        return
+
+    if args.text_path:
+        parser = create_parser()
+        parser.processing_config['vies_job_runner'] = 'detached'
+        run_text_mode(parser, args.text_path, args.confidence)
+        if parser.vies_jobs_started:
+            _spawn_vies_job_runner()
+        return
+
+    if args.manifest or len(args.image_paths) > 1 or any(Path(p).is_dir() for p in args.image_paths):
+        image_paths = _resolve_batch_inputs(args.image_paths, args.manifest)
+        run_batch(create_parser(), image_paths, max(1, args.batch_size))
+        return
+
+    if not args.image_paths:
+        arg_parser.error('missing image path')
+
+    image_path = args.image_paths[0]
+
     # Check if file exists
     if not Path(image_path).exists():
         print(json.dumps({
@@ -1443,11 +4020,14 @@ def main():
         return
     
     # Process the receipt
-    parser = DutchReceiptParser()
+    parser = create_parser()
+    parser.processing_config['vies_job_runner'] = 'detached'
     result = parser.process_receipt(image_path)
     
     # Output as JSON
     print(json.dumps(result, ensure_ascii=False, indent=2))
+    if parser.vies_jobs_started:
+        _spawn_vies_job_runner()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -18,7 +18,7 @@ try:
     print("=" * 60)
     print()
 
-    # Initialize parser (this will test endpoint connectivity)
+    # Initialize parser (PaddleOCR is loaded lazily, so this only builds the LLM configuration)
     parser = DutchReceiptParser()
 
     print("✓ OCR Processor initialized successfully")